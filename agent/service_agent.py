@@ -1,8 +1,12 @@
 import json
+import time
+import asyncio
 import logging
-from typing import Dict
+from typing import Dict, Any, AsyncGenerator, Awaitable, Callable, Optional, Tuple
 from semantic_kernel.functions.kernel_arguments import KernelArguments
-from kernel.setup import SemanticKernelConfig
+from config import SERVICE_MATCH_THRESHOLD, SERVICE_MATCH_THRESHOLDS, SERVICE_MATCH_HIGH_CONFIDENCE, PLUGIN_FAST_PATH
+from dispatch_metrics import begin_turn, end_turn, record_call
+from kernel.setup import get_kernel_config
 from models import ChatResponse
 from utils import sanitize_collection_name
 from semantic_kernel.contents.chat_history import ChatHistory
@@ -11,10 +15,23 @@ from semantic_kernel.contents import AuthorRole
 
 logger = logging.getLogger(__name__)
 
+# Service names used by the identification error result and the agent fallbacks when no service was found
+UNIDENTIFIED_SERVICE_NAMES = {"غير محدد", "خدمة غير محددة"}
+
+
+def is_cacheable_identification(service_data: Dict[str, Any]) -> bool:
+    """Only real identifications go into the semantic cache: a cached error or "not identified"
+    result would be served to every similar first message until it expires"""
+    return (
+        not service_data.get("error")
+        and str(service_data.get("service_name", "")).strip() not in UNIDENTIFIED_SERVICE_NAMES
+        and bool(service_data.get("required_fields"))
+    )
+
 
 # SemanticKernelServiceAgent - Fixed identify_service method
 class SemanticKernelServiceAgent:
-    def __init__(self, session_id: str, namespace: str = "default"):
+    def __init__(self, session_id: str, namespace: str = "default", sk_config=None):
         self.session_id = session_id
         self.namespace = namespace
         self.state = "initial"
@@ -26,8 +43,9 @@ class SemanticKernelServiceAgent:
 
         self.chat_history = ChatHistory()
         
-        # Initialize Semantic Kernel
-        self.sk_config = SemanticKernelConfig()
+        # Use the shared Semantic Kernel (models and plugins are loaded once per process).
+        # Coroutines pass it in from get_kernel_config_async so the first load does not block the loop.
+        self.sk_config = sk_config or get_kernel_config()
         self.kernel = self.sk_config.kernel
         
         # Setup memory for this namespace
@@ -51,6 +69,41 @@ class SemanticKernelServiceAgent:
             )
         )
 
+    def to_state(self, history_limit: Optional[int] = None) -> Dict[str, Any]:
+        """Conversation state as plain JSON-compatible data (the kernel is not part of it);
+        keeps the last `history_limit` messages of the chat history, or all of them"""
+        messages = self.chat_history.messages
+        if history_limit is not None:
+            messages = messages[-history_limit:] if history_limit else []
+        return {
+            "session_id": self.session_id,
+            "namespace": self.namespace,
+            "state": self.state,
+            "service_info": self.service_info,
+            "collected_data": self.collected_data,
+            "current_field_index": self.current_field_index,
+            "required_fields": self.required_fields,
+            "validation_attempts": self.validation_attempts,
+            "history": [["u" if msg.role == AuthorRole.USER else "a", msg.content] for msg in messages]
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], sk_config=None) -> "SemanticKernelServiceAgent":
+        """Rebuild an agent saved with to_state()"""
+        agent = cls(state["session_id"], state.get("namespace", "default"), sk_config=sk_config)
+        agent.state = state.get("state", "initial")
+        agent.service_info = state.get("service_info")
+        agent.collected_data = state.get("collected_data") or {}
+        agent.current_field_index = state.get("current_field_index", 0)
+        agent.required_fields = state.get("required_fields") or []
+        agent.validation_attempts = state.get("validation_attempts") or {}
+        for role, content in state.get("history", []):
+            if role == "u":
+                agent.add_user_message(content)
+            else:
+                agent.add_assistant_message(content)
+        return agent
+
     def get_conversation_context(self, last_n_messages: int = 5) -> str:
         """Get recent conversation context for better responses"""
         messages = self.chat_history.messages[-last_n_messages:] if len(self.chat_history.messages) > last_n_messages else self.chat_history.messages
@@ -71,54 +124,98 @@ class SemanticKernelServiceAgent:
         except Exception as e:
             logger.error(f"Error setting up namespace memory: {e}")
     
+    async def invoke_function(self, plugin_name: str, function_name: str, arguments: KernelArguments):
+        """kernel.invoke, timed for the per-turn dispatch metrics"""
+        started = time.perf_counter()
+        try:
+            return await self.kernel.invoke(
+                plugin_name=plugin_name,
+                function_name=function_name,
+                arguments=arguments
+            )
+        finally:
+            record_call(f"{plugin_name}.{function_name}", "kernel", time.perf_counter() - started)
+
+    async def search_memory(self, user_message: str, query_embedding=None, limit: int = 5) -> str:
+        """Search the namespace's collections concurrently and merge results into one top-k context"""
+        if not self.sk_config.memory_store:
+            return ""
+        
+        collections = await self.sk_config.get_collections()
+        
+        # Prefer this namespace's collections; fall back to every document collection
+        candidates = [c for c in collections if c.startswith(f"documents_{self.namespace}") or c == self.memory_collection]
+        if not candidates:
+            logger.warning(f"Collection {self.memory_collection} not found, searching all document collections")
+            candidates = [c for c in collections if c.startswith("documents_")]
+        if not candidates:
+            return ""
+        
+        # Embed the query once and reuse it for every collection
+        if query_embedding is None:
+            query_embedding = (await self.sk_config.embedding_service.generate_embeddings([user_message]))[0]
+        
+        results = await asyncio.gather(*[
+            self.sk_config.memory_store.get_nearest_matches(
+                collection_name=collection,
+                embedding=query_embedding,
+                limit=limit,
+                min_relevance_score=0.0,
+                with_embeddings=False
+            )
+            for collection in candidates
+        ], return_exceptions=True)
+        
+        matches = []
+        for collection, result in zip(candidates, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to search in {collection}: {result}")
+                continue
+            matches.extend(result)
+        
+        # Global top-k by relevance across all searched collections
+        matches.sort(key=lambda match: match[1], reverse=True)
+        top_matches = matches[:limit]
+        logger.info(f"Found {len(top_matches)} relevant memories across {len(candidates)} collections")
+        return "\n".join(record.text for record, _ in top_matches)
+
     async def identify_service(self, user_message: str) -> Dict:
         """Use Semantic Kernel function calling to identify service with improved collection handling"""
         try:
-            context = ""
+            # Paraphrases of earlier first messages are answered from the namespace's semantic cache
+            query_embedding = None
+            service_cache = self.sk_config.service_cache
+            if service_cache:
+                try:
+                    query_embedding = (await self.sk_config.embedding_service.generate_embeddings([user_message]))[0]
+                    cached_service = service_cache.lookup(self.namespace, query_embedding)
+                    if cached_service:
+                        return cached_service
+                except Exception as cache_error:
+                    logger.warning(f"Service cache lookup failed: {cache_error}")
+                    query_embedding = None
+            
+            # Nearest catalogued service; the LLM is only asked when no service matches closely enough
+            service_catalog = self.sk_config.service_catalog
+            if service_catalog:
+                try:
+                    if query_embedding is None:
+                        query_embedding = (await self.sk_config.embedding_service.generate_embeddings([user_message]))[0]
+                    match = service_catalog.match(self.namespace, query_embedding)
+                    threshold = SERVICE_MATCH_THRESHOLDS.get(self.namespace, SERVICE_MATCH_THRESHOLD)
+                    if match and match[1] >= threshold:
+                        service_data, score = match
+                        logger.info(f"Service matched from catalog: {service_data['service_name']} (similarity {score:.3f})")
+                        confidence = "عالي" if score >= SERVICE_MATCH_HIGH_CONFIDENCE else "متوسط"
+                        return {**service_data, "confidence": confidence, "match_score": round(score, 4)}
+                    if match:
+                        logger.info(f"Best catalog match {match[0]['service_name']} below threshold ({match[1]:.3f}), using LLM")
+                except Exception as catalog_error:
+                    logger.warning(f"Service catalog lookup failed: {catalog_error}")
             
             # Search in memory with improved error handling
             try:
-                if self.sk_config.semantic_memory:
-                    # List available collections first
-                    try:
-                        collections = await self.sk_config.memory_store.get_collections()
-                        logger.info(f"Available collections: {collections}")
-                        
-                        # Check if our collection exists
-                        if self.memory_collection in collections:
-                            logger.info(f"Found collection: {self.memory_collection}")
-                            
-                            # Search in the collection
-                            memories = await self.sk_config.semantic_memory.search(
-                                collection=self.memory_collection,
-                                query=user_message,
-                                limit=5
-                            )
-                            context = "\n".join([mem.text for mem in memories])
-                            logger.info(f"Found {len(memories)} relevant memories")
-                        else:
-                            logger.warning(f"Collection {self.memory_collection} not found in {collections}")
-                            
-                            # Try to search in all available collections
-                            for collection in collections:
-                                if collection.startswith(f"documents_{self.namespace}") or collection.startswith("documents_"):
-                                    try:
-                                        memories = await self.sk_config.semantic_memory.search(
-                                            collection=collection,
-                                            query=user_message,
-                                            limit=3
-                                        )
-                                        if memories:
-                                            context += "\n".join([mem.text for mem in memories])
-                                            logger.info(f"Found memories in alternate collection: {collection}")
-                                            break
-                                    except Exception as alt_search_error:
-                                        logger.warning(f"Failed to search in {collection}: {alt_search_error}")
-                                        continue
-                    except Exception as collections_error:
-                        logger.warning(f"Could not get collections: {collections_error}")
-                        context = ""
-                        
+                context = await self.search_memory(user_message, query_embedding)
             except Exception as search_error:
                 logger.warning(f"Could not search semantic memory: {search_error}")
                 context = ""
@@ -130,11 +227,7 @@ class SemanticKernelServiceAgent:
                 kernel=self.kernel
             )
             
-            result = await self.kernel.invoke(
-                plugin_name="service_id",
-                function_name="identify_service",
-                arguments=arguments
-            )
+            result = await self.invoke_function("service_id", "identify_service", arguments)
             
             # Parse JSON result with better error handling
             try:
@@ -145,6 +238,9 @@ class SemanticKernelServiceAgent:
                     
                 logger.info(f"Service identified: {service_data['service_name']} with confidence {service_data.get('confidence', 'unknown')}")
                 
+                if service_cache and query_embedding is not None and is_cacheable_identification(service_data):
+                    service_cache.store(self.namespace, query_embedding, service_data, user_message)
+                
             except (json.JSONDecodeError, ValueError) as parse_error:
                 logger.warning(f"Could not parse service identification result: {parse_error}")
                 # Provide intelligent defaults based on user message
@@ -168,30 +264,40 @@ class SemanticKernelServiceAgent:
                 "estimated_processing_time": "غير محدد"
             }
     
-    async def validate_input(self, field_name: str, value: str) -> tuple[bool, str]:
-        """Use validation plugin for input validation"""
+    async def validate_input(self, field_name: str, value: str) -> tuple[bool, str, str]:
+        """Use validation plugin for input validation; returns (is_valid, error_message, normalised value)"""
         try:
+            if PLUGIN_FAST_PATH:
+                started = time.perf_counter()
+                result = self.sk_config.validation_plugin.check(field_name, value)
+                record_call("validation.validate_field", "direct", time.perf_counter() - started)
+                return result
+            
             arguments = KernelArguments(
                 field_name=field_name,
                 value=value
             )
             
-            result = await self.kernel.invoke(
-                plugin_name="validation",
-                function_name="validate_field",
-                arguments=arguments
-            )
+            result = await self.invoke_function("validation", "validate_field", arguments)
             
             validation_result = json.loads(str(result))
-            return validation_result["is_valid"], validation_result["error_message"]
+            return validation_result["is_valid"], validation_result["error_message"], validation_result["value"]
             
         except Exception as e:
             logger.error(f"Error in validation: {e}")
-            return False, f"خطأ في التحقق: {str(e)}"
+            return False, f"خطأ في التحقق: {str(e)}", value
     
     async def create_service_request(self, service_name: str, user_data: Dict) -> Dict:
         """Use database plugin to create service request"""
         try:
+            if PLUGIN_FAST_PATH:
+                started = time.perf_counter()
+                result = await self.sk_config.database_plugin.create_request_record(
+                    service_name, user_data, self.session_id, self.namespace
+                )
+                record_call("database.create_request", "direct", time.perf_counter() - started)
+                return result
+            
             arguments = KernelArguments(
                 service_name=service_name,
                 user_data=json.dumps(user_data),
@@ -199,11 +305,7 @@ class SemanticKernelServiceAgent:
                 namespace=self.namespace
             )
             
-            result = await self.kernel.invoke(
-                plugin_name="database",
-                function_name="create_request",
-                arguments=arguments
-            )
+            result = await self.invoke_function("database", "create_request", arguments)
             
             return json.loads(str(result))
             
@@ -229,11 +331,7 @@ class SemanticKernelServiceAgent:
                 kernel=self.kernel
             )
             
-            result = await self.kernel.invoke(
-                plugin_name="conversation", 
-                function_name="generate_response",
-                arguments=arguments
-            )
+            result = await self.invoke_function("conversation", "generate_response", arguments)
             
             return str(result)
             
@@ -241,7 +339,55 @@ class SemanticKernelServiceAgent:
             logger.error(f"Error generating response: {e}")
             return "عذراً، حدث خطأ في معالجة طلبك."
      
-    async def process_message(self, user_message: str) -> "ChatResponse":
+    async def process_message_stream(self, user_message: str) -> AsyncGenerator[Tuple[str, Any], None]:
+        """Process a message, yielding (event, data) pairs: "progress" while a slow step
+        runs, then the reply text as a "reply" event, structured events (service_identified,
+        next_field, validation_error, completed) and finally the full ChatResponse as a
+        "response" event. Replies are built from templates once the turn's work is done,
+        so there are no model tokens to stream; the service identification JSON is never sent."""
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        async def on_event(event: str, data: Any):
+            await queue.put((event, data))
+        
+        task = asyncio.create_task(self.process_message(user_message, on_event=on_event))
+        try:
+            while not task.done():
+                getter = asyncio.create_task(queue.get())
+                done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            while not queue.empty():
+                yield queue.get_nowait()
+        finally:
+            if not task.done():
+                task.cancel()
+        
+        response = task.result()
+        if response.response:
+            yield "reply", response.response
+        if response.service_identified and response.service_info:
+            yield "service_identified", response.service_info
+        if response.next_field:
+            yield "next_field", response.next_field
+        if response.validation_error:
+            yield "validation_error", response.validation_error
+        if response.completed:
+            yield "completed", True
+        yield "response", response.model_dump() if hasattr(response, "model_dump") else response.dict()
+     
+    async def process_message(self, user_message: str, on_event: Optional[Callable[[str, Any], Awaitable[None]]] = None) -> "ChatResponse":
+        """Process one chat turn, recording how its time splits between kernel dispatch and work.
+        `on_event(event, data)`, if given, receives progress events for the streaming endpoint."""
+        token = begin_turn()
+        try:
+            return await self._process_message(user_message, on_event)
+        finally:
+            end_turn(token)
+    
+    async def _process_message(self, user_message: str, on_event: Optional[Callable[[str, Any], Awaitable[None]]] = None) -> "ChatResponse":
         """Enhanced message processing with chat history"""
         try:
             # Add user message to chat history
@@ -250,6 +396,8 @@ class SemanticKernelServiceAgent:
             # Rest of your existing logic remains the same...
             if self.state == "initial":
                 logger.info(f"Identifying service for message: {user_message}")
+                if on_event:
+                    await on_event("progress", "identifying_service")
                 service_info = await self.identify_service(user_message)
                 
                 self.service_info = service_info
@@ -291,7 +439,7 @@ class SemanticKernelServiceAgent:
                 current_field = self.required_fields[self.current_field_index]
                 
                 # Validate input using Semantic Kernel
-                is_valid, error_message = await self.validate_input(current_field, user_message)
+                is_valid, error_message, normalized_value = await self.validate_input(current_field, user_message)
                 
                 if not is_valid:
                     # Track validation attempts
@@ -321,12 +469,12 @@ class SemanticKernelServiceAgent:
                     )
                 
                 # Input is valid, save it
-                self.collected_data[current_field] = user_message.strip()
+                self.collected_data[current_field] = normalized_value
                 self.current_field_index += 1
                 
                 if self.current_field_index < len(self.required_fields):
                     next_field = self.required_fields[self.current_field_index]
-                    response_text = f"✅ تم حفظ **{current_field}**: {user_message}\n\n🔹 يرجى تزويدي بالمعلومة التالية:\n**{next_field}**\n\n💡"
+                    response_text = f"✅ تم حفظ **{current_field}**: {normalized_value}\n\n🔹 يرجى تزويدي بالمعلومة التالية:\n**{next_field}**\n\n💡"
                     self.add_assistant_message(response_text)
                     
                     return ChatResponse(
@@ -344,7 +492,7 @@ class SemanticKernelServiceAgent:
                     self.state = "completed"
                     
                     data_summary = "\n".join([f"• **{k}**: {v}" for k, v in self.collected_data.items()])
-                    response_text = f"✅ تم حفظ **{current_field}**: {user_message}\n\n📋 **ملخص البيانات المجمعة:**\n{data_summary}\n\n{result['message']}"
+                    response_text = f"✅ تم حفظ **{current_field}**: {normalized_value}\n\n📋 **ملخص البيانات المجمعة:**\n{data_summary}\n\n{result['message']}"
                     self.add_assistant_message(response_text)
                     
                     return ChatResponse(
@@ -0,0 +1,109 @@
+"""Latency and recall of the numpy flat-index store against Chroma.
+
+Usage:
+    python -m benchmarks.vector_store_benchmark --sizes 1000 10000 100000
+
+Random unit vectors stand in for chunk embeddings (all-MiniLM-L6-v2 is 384-d).
+Recall@k is measured against exact brute-force neighbours, so the float32 flat
+index scores 1.0 and the interesting numbers are Chroma's HNSW recall and the
+float16 flat index. Use the results to pick VECTOR_STORE_BACKEND / NUMPY_STORE_NAMESPACES.
+"""
+import argparse
+import asyncio
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from semantic_kernel.memory.memory_record import MemoryRecord
+
+from kernel.numpy_memory_store import NumpyMemoryStore
+
+COLLECTION = "documents_benchmark"
+
+
+def make_records(vectors: np.ndarray):
+    return [
+        MemoryRecord.local_record(
+            id=f"chunk_{i}", text=f"chunk {i}", description="benchmark",
+            additional_metadata="", embedding=vector
+        )
+        for i, vector in enumerate(vectors)
+    ]
+
+
+async def load(store, records, batch_size: int = 1000) -> float:
+    await store.create_collection(COLLECTION)
+    started = time.perf_counter()
+    for start in range(0, len(records), batch_size):
+        await store.upsert_batch(COLLECTION, records[start:start + batch_size])
+    return time.perf_counter() - started
+
+
+async def query(store, queries: np.ndarray, truth: np.ndarray, k: int):
+    latencies, hits = [], 0
+    for q, expected in zip(queries, truth):
+        started = time.perf_counter()
+        matches = await store.get_nearest_matches(COLLECTION, q, limit=k, min_relevance_score=-1.0)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found = {int(record.id.split("_")[1]) for record, _ in matches}
+        hits += len(found & set(expected.tolist()))
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "recall": hits / (len(queries) * k)
+    }
+
+
+def make_stores(workdir: str):
+    stores = {
+        "numpy-f32": lambda: NumpyMemoryStore(f"{workdir}/f32", dtype="float32"),
+        "numpy-f16": lambda: NumpyMemoryStore(f"{workdir}/f16", dtype="float16"),
+    }
+    try:
+        from semantic_kernel.connectors.memory.chroma import ChromaMemoryStore
+        stores["chroma"] = lambda: ChromaMemoryStore(persist_directory=f"{workdir}/chroma")
+    except ImportError as e:
+        print(f"Skipping Chroma: {e}")
+    return stores
+
+
+async def run(sizes, dim: int, queries_per_size: int, k: int):
+    rng = np.random.default_rng(0)
+    print(f"{'size':>8} {'store':>10} {'load_s':>8} {'p50_ms':>8} {'p95_ms':>8} {'recall@' + str(k):>9}")
+    for size in sizes:
+        vectors = rng.standard_normal((size, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        queries = rng.standard_normal((queries_per_size, dim)).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+        records = make_records(vectors)
+
+        workdir = tempfile.mkdtemp(prefix="vector_bench_")
+        try:
+            for name, factory in make_stores(workdir).items():
+                store = factory()
+                load_seconds = await load(store, records)
+                result = await query(store, queries, truth, k)
+                print(
+                    f"{size:>8} {name:>10} {load_seconds:>8.2f} {result['p50_ms']:>8.2f} "
+                    f"{result['p95_ms']:>8.2f} {result['recall']:>9.3f}"
+                )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.dim, args.queries, args.k))
+
+
+if __name__ == "__main__":
+    main()
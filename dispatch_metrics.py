@@ -0,0 +1,138 @@
+import time
+import logging
+import threading
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TurnMetrics:
+    """Timing of one chat turn, split into kernel dispatch and the work of the functions it ran.
+
+    For a kernel call, `function_seconds` is measured inside the function
+    invocation filter, so `total - function` is the cost of going through the
+    kernel (argument binding, filters, result wrapping). Direct calls have no
+    dispatch cost by construction.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.calls: List[Dict[str, Any]] = []
+        self._pending_function_seconds: Optional[float] = None
+
+    def record_function(self, seconds: float):
+        """Called by the function invocation filter with the time spent inside the function"""
+        self._pending_function_seconds = seconds
+
+    def record_call(self, name: str, path: str, total_seconds: float):
+        """Record a finished call; `path` is "kernel", "kernel_stream" or "direct" """
+        function_seconds = total_seconds
+        if path == "kernel" and self._pending_function_seconds is not None:
+            function_seconds = min(self._pending_function_seconds, total_seconds)
+        self._pending_function_seconds = None
+        self.calls.append({
+            "name": name,
+            "path": path,
+            "total_seconds": total_seconds,
+            "function_seconds": function_seconds,
+            "dispatch_seconds": total_seconds - function_seconds
+        })
+
+    def summary(self) -> Dict[str, Any]:
+        turn_seconds = time.perf_counter() - self.started
+        dispatch = sum(call["dispatch_seconds"] for call in self.calls)
+        return {
+            "turn_seconds": turn_seconds,
+            "dispatch_seconds": dispatch,
+            "function_seconds": sum(call["function_seconds"] for call in self.calls),
+            "agent_seconds": turn_seconds - sum(call["total_seconds"] for call in self.calls),
+            "dispatch_share": dispatch / turn_seconds if turn_seconds else 0.0,
+            "calls": self.calls
+        }
+
+
+class DispatchStats:
+    """Process-wide totals of chat-turn timings, per call path and per function"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.turn_seconds = 0.0
+        self.dispatch_seconds = 0.0
+        self.function_seconds = 0.0
+        self.functions: Dict[str, Dict[str, Any]] = {}
+
+    def add_turn(self, summary: Dict[str, Any]):
+        with self._lock:
+            self.turns += 1
+            self.turn_seconds += summary["turn_seconds"]
+            self.dispatch_seconds += summary["dispatch_seconds"]
+            self.function_seconds += summary["function_seconds"]
+            for call in summary["calls"]:
+                entry = self.functions.setdefault(f"{call['path']}:{call['name']}", {
+                    "calls": 0, "total_seconds": 0.0, "dispatch_seconds": 0.0
+                })
+                entry["calls"] += 1
+                entry["total_seconds"] += call["total_seconds"]
+                entry["dispatch_seconds"] += call["dispatch_seconds"]
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "turn_seconds": round(self.turn_seconds, 4),
+                "dispatch_seconds": round(self.dispatch_seconds, 4),
+                "function_seconds": round(self.function_seconds, 4),
+                "dispatch_share": round(self.dispatch_seconds / self.turn_seconds, 4) if self.turn_seconds else 0.0,
+                "functions": {
+                    name: {
+                        "calls": entry["calls"],
+                        "avg_ms": round(entry["total_seconds"] / entry["calls"] * 1000, 3),
+                        "avg_dispatch_ms": round(entry["dispatch_seconds"] / entry["calls"] * 1000, 3)
+                    }
+                    for name, entry in self.functions.items()
+                }
+            }
+
+
+_current_turn: ContextVar[Optional[TurnMetrics]] = ContextVar("dispatch_turn", default=None)
+
+def begin_turn():
+    """Start timing a chat turn in the current context; returns a token for end_turn"""
+    return _current_turn.set(TurnMetrics())
+
+def end_turn(token) -> Optional[Dict[str, Any]]:
+    """Finish the current turn, add it to the process-wide stats and log its breakdown"""
+    turn = _current_turn.get()
+    _current_turn.reset(token)
+    if turn is None:
+        return None
+    summary = turn.summary()
+    dispatch_stats.add_turn(summary)
+    logger.info(
+        f"Chat turn {summary['turn_seconds'] * 1000:.1f}ms: "
+        f"kernel dispatch {summary['dispatch_seconds'] * 1000:.2f}ms, "
+        f"functions {summary['function_seconds'] * 1000:.1f}ms, "
+        f"agent {summary['agent_seconds'] * 1000:.1f}ms"
+    )
+    return summary
+
+def record_call(name: str, path: str, total_seconds: float):
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.record_call(name, path, total_seconds)
+
+async def function_timing_filter(context, next):
+    """Kernel function invocation filter measuring the time spent inside each function"""
+    started = time.perf_counter()
+    try:
+        await next(context)
+    finally:
+        turn = _current_turn.get()
+        if turn is not None:
+            turn.record_function(time.perf_counter() - started)
+
+
+# Process-wide stats, exposed by the /metrics/dispatch endpoint
+dispatch_stats = DispatchStats()
@@ -0,0 +1,311 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import INGEST_WORKERS, INGEST_QUEUE_SIZE, INGEST_JOB_RETENTION, PARSE_WORKERS
+from kernel.plugins.document import parse_document
+
+logger = logging.getLogger(__name__)
+
+
+def parse_document_timed(file_path: str) -> Tuple[List[str], float]:
+    """parse_document plus how long it took, measured in the worker process"""
+    started = time.perf_counter()
+    texts = parse_document(file_path)
+    return texts, time.perf_counter() - started
+
+
+class IngestionJob:
+    """State and progress counters of one background document ingestion"""
+
+    def __init__(self, file_path: str, file_name: str, namespace: str, collection_name: str,
+                 file_hash: str = "", file_size: int = 0):
+        self.job_id = str(uuid.uuid4())
+        self.file_path = file_path
+        self.file_name = file_name
+        self.namespace = namespace
+        self.collection_name = collection_name
+        self.file_hash = file_hash
+        self.file_size = file_size
+        self.status = "queued"
+        self.stage = "queued"
+        self.total_chunks = 0
+        self.chunks_parsed = 0
+        self.chunks_embedded = 0
+        self.chunks_written = 0
+        self.chunks_skipped = 0
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    async def execute(self, sk_config) -> Dict[str, Any]:
+        """Parse and store the file; returns the DocumentPlugin result"""
+        return await sk_config.document_plugin.ingest(
+            file_path=self.file_path,
+            namespace=self.namespace,
+            collection_name=self.collection_name,
+            embedding_service=sk_config.embedding_service,
+            file_hash=self.file_hash,
+            file_size=self.file_size,
+            progress=self
+        )
+
+    def temp_files(self) -> List[str]:
+        return [self.file_path]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "stage": self.stage,
+            "file_name": self.file_name,
+            "namespace": self.namespace,
+            "collection_name": self.collection_name,
+            "file_hash": self.file_hash,
+            "size_bytes": self.file_size,
+            "progress": {
+                "total_chunks": self.total_chunks,
+                "chunks_parsed": self.chunks_parsed,
+                "chunks_embedded": self.chunks_embedded,
+                "chunks_written": self.chunks_written,
+                "chunks_skipped": self.chunks_skipped
+            },
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class BatchIngestionJob(IngestionJob):
+    """Ingestion of several files: parsed in parallel, embedded through one shared batcher"""
+
+    def __init__(self, files: List[Dict[str, Any]], namespace: str, collection_name: str):
+        super().__init__(
+            file_path="",
+            file_name=", ".join(f["file_name"] for f in files),
+            namespace=namespace,
+            collection_name=collection_name,
+            file_size=sum(f["file_size"] for f in files)
+        )
+        # Each entry: {"file_path", "file_name", "file_hash", "file_size"}
+        self.files = files
+
+    async def execute(self, sk_config) -> Dict[str, Any]:
+        plugin = sk_config.document_plugin
+        catalog = plugin.catalog
+        started = time.perf_counter()
+        file_results: Dict[str, Dict[str, Any]] = {}
+
+        # Files whose content is already in the collection are not parsed at all
+        to_parse = []
+        for index, entry in enumerate(self.files):
+            file_key = str(index)
+            if catalog and entry["file_hash"] and catalog.has_document(self.collection_name, entry["file_hash"]):
+                file_results[file_key] = {"file_name": entry["file_name"], "status": "duplicate_file"}
+            else:
+                to_parse.append((file_key, entry))
+
+        self.stage = "parsing"
+        batcher = await plugin.create_batcher(self.collection_name, sk_config.embedding_service, progress=self)
+        loop = asyncio.get_running_loop()
+        pool = get_parse_pool()
+        parse_tasks = {
+            loop.run_in_executor(pool, parse_document_timed, entry["file_path"]): (file_key, entry)
+            for file_key, entry in to_parse
+        }
+
+        # Feed each file into the shared embedding batcher as soon as its parse finishes.
+        # parse_seconds sums the per-file parse times in the workers, so embedding done
+        # on the event loop meanwhile is not counted as parsing.
+        parse_seconds = 0.0
+        pending = set(parse_tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                file_key, entry = parse_tasks[task]
+                try:
+                    texts, file_parse_seconds = task.result()
+                except Exception as parse_error:
+                    logger.warning(f"Failed to parse {entry['file_name']}: {parse_error}")
+                    file_results[file_key] = {
+                        "file_name": entry["file_name"],
+                        "status": "error",
+                        "error": str(parse_error)
+                    }
+                    continue
+                parse_seconds += file_parse_seconds
+                self.chunks_parsed += len(texts)
+                self.stage = "embedding"
+                await batcher.add(file_key, entry["file_name"], texts)
+        await batcher.flush()
+        await plugin.persist(batcher.memory_store)
+        if any(stats["chunks_new"] for stats in batcher.files.values()):
+            plugin.notify_changed(self.namespace, self.collection_name)
+
+        for file_key, entry in to_parse:
+            if file_key in file_results:
+                continue
+            stats = batcher.files.get(file_key, {
+                "file_name": entry["file_name"], "total_chunks": 0, "unique_chunks": 0,
+                "chunks_new": 0, "chunks_skipped": 0, "chunks_failed": 0
+            })
+            status = "success" if stats["chunks_failed"] == 0 else "partial_error"
+            if catalog:
+                if status == "success" and entry["file_hash"]:
+                    catalog.record_document(
+                        self.namespace, self.collection_name, entry["file_hash"], entry["file_name"],
+                        size_bytes=entry["file_size"], chunk_count=stats["unique_chunks"],
+                        new_chunks=stats["chunks_new"]
+                    )
+                elif stats["chunks_new"]:
+                    catalog.add_chunks(self.namespace, self.collection_name, stats["chunks_new"])
+            file_results[file_key] = {"status": status, **stats}
+
+        elapsed = time.perf_counter() - started
+        services_catalogued = await plugin.refresh_services(self.namespace, batcher.new_texts, progress=self)
+        chunks_total = sum(stats["total_chunks"] for stats in batcher.files.values())
+        results = [file_results[str(index)] for index in range(len(self.files))]
+        return {
+            "status": "success" if all(r["status"] in ("success", "duplicate_file") for r in results) else "partial_error",
+            "collection_name": self.collection_name,
+            "namespace": self.namespace,
+            "files": results,
+            "failed_batches": batcher.failed_batches,
+            "services_catalogued": services_catalogued,
+            "throughput": {
+                "files": len(self.files),
+                "files_parsed": len(to_parse),
+                "chunks": chunks_total,
+                "bytes": self.file_size,
+                "parse_seconds": round(parse_seconds, 3),
+                "elapsed_seconds": round(elapsed, 3),
+                "files_per_second": round(len(self.files) / elapsed, 3) if elapsed else 0.0,
+                "chunks_per_second": round(chunks_total / elapsed, 3) if elapsed else 0.0,
+                "megabytes_per_second": round(self.file_size / 1e6 / elapsed, 3) if elapsed else 0.0,
+                "parse_workers": PARSE_WORKERS
+            }
+        }
+
+    def temp_files(self) -> List[str]:
+        return [entry["file_path"] for entry in self.files]
+
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """Process pool for CPU-bound document parsing, created on first use"""
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+    return _parse_pool
+
+def shutdown_parse_pool():
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+
+
+class IngestionQueueFull(Exception):
+    """Raised when the ingestion queue cannot accept more jobs"""
+
+
+class IngestionQueue:
+    """Bounded queue of ingestion jobs drained by a fixed pool of background workers.
+
+    Jobs run independently of the HTTP request that submitted them, so a client
+    timeout does not cancel processing.
+    """
+
+    def __init__(self, workers: int, max_queued: int, retention: int):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention = retention
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+
+    def start(self):
+        """Start the worker tasks; must be called from the running event loop"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Started {self.workers} ingestion workers (queue size {self.max_queued})")
+
+    async def stop(self):
+        """Cancel the workers; queued jobs are left in 'queued' state"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job: IngestionJob) -> IngestionJob:
+        if self._queue is None:
+            raise RuntimeError("Ingestion queue is not started")
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise IngestionQueueFull(f"ingestion queue is full ({self.max_queued} jobs)")
+        self.jobs[job.job_id] = job
+        self._prune()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond the retention limit"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in ("completed", "failed")]
+        for job_id in finished[:max(0, len(self.jobs) - self.retention)]:
+            del self.jobs[job_id]
+
+    async def _worker(self, worker_index: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: IngestionJob):
+        # Imported here so the kernel (and its models) load on the first job, not at import
+        from kernel.setup import get_kernel_config_async
+
+        job.status = "running"
+        job.started_at = datetime.now()
+        try:
+            sk_config = await get_kernel_config_async()
+            result = await job.execute(sk_config)
+            job.result = result
+            if result.get("status") == "error":
+                job.status = "failed"
+                job.error = result.get("message")
+            else:
+                job.status = "completed"
+        except Exception as e:
+            logger.error(f"Ingestion job {job.job_id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.stage = "done"
+            job.finished_at = datetime.now()
+            for file_path in job.temp_files():
+                try:
+                    Path(file_path).unlink(missing_ok=True)
+                except Exception as cleanup_error:
+                    logger.warning(f"Could not clean up temporary file: {cleanup_error}")
+
+
+# Process-wide queue, started and stopped by the FastAPI lifecycle hooks in main.py
+ingestion_queue = IngestionQueue(INGEST_WORKERS, INGEST_QUEUE_SIZE, INGEST_JOB_RETENTION)
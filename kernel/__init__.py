@@ -1,4 +1,3 @@
+from .setup import SemanticKernelConfig, get_kernel_config, get_kernel_config_async
 
-from .setup import SemanticKernelConfig
-
-__all__ = ['SemanticKernelConfig']
+__all__ = ['SemanticKernelConfig', 'get_kernel_config', 'get_kernel_config_async']
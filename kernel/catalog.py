@@ -0,0 +1,174 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from config import CATALOG_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentCatalog:
+    """Persistent catalog of namespaces -> collections -> source documents.
+
+    Ingestion keeps it up to date, so listing namespaces, collections and
+    documents are indexed lookups instead of scans of the vector store.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                collection_name TEXT NOT NULL,
+                file_hash TEXT NOT NULL,
+                namespace TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL DEFAULT 0,
+                chunk_count INTEGER NOT NULL DEFAULT 0,
+                ingested_at TEXT NOT NULL,
+                PRIMARY KEY (collection_name, file_hash)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS collections (
+                collection_name TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                document_count INTEGER NOT NULL DEFAULT 0,
+                chunk_count INTEGER NOT NULL DEFAULT 0,
+                size_bytes INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_collections_namespace ON collections(namespace)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_namespace ON documents(namespace)")
+        self._conn.commit()
+
+    def has_document(self, collection_name: str, file_hash: str) -> bool:
+        """Check whether a file with this content hash was already ingested into the collection"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM documents WHERE collection_name = ? AND file_hash = ?",
+                (collection_name, file_hash)
+            ).fetchone()
+        return row is not None
+
+    def record_document(
+        self,
+        namespace: str,
+        collection_name: str,
+        file_hash: str,
+        file_name: str,
+        size_bytes: int = 0,
+        chunk_count: int = 0,
+        new_chunks: int = 0
+    ):
+        """Record a fully ingested file and update its collection's totals.
+        `new_chunks` is how many chunks were actually added to the collection."""
+        now = datetime.now().isoformat()
+        with self._lock:
+            exists = self._conn.execute(
+                "SELECT 1 FROM documents WHERE collection_name = ? AND file_hash = ?",
+                (collection_name, file_hash)
+            ).fetchone() is not None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents "
+                "(collection_name, file_hash, namespace, file_name, size_bytes, chunk_count, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (collection_name, file_hash, namespace, file_name, size_bytes, chunk_count, now)
+            )
+            self._upsert_collection(
+                namespace, collection_name,
+                documents=0 if exists else 1,
+                chunks=new_chunks,
+                size_bytes=0 if exists else size_bytes,
+                now=now
+            )
+            self._conn.commit()
+
+    def add_chunks(self, namespace: str, collection_name: str, new_chunks: int):
+        """Account for chunks written without a completed document (e.g. partial ingestion)"""
+        with self._lock:
+            self._upsert_collection(namespace, collection_name, 0, new_chunks, 0, datetime.now().isoformat())
+            self._conn.commit()
+
+    def register_collection(self, namespace: str, collection_name: str, chunk_count: int = 0):
+        """Add a collection that exists in the vector store but is not yet catalogued"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO collections "
+                "(collection_name, namespace, document_count, chunk_count, size_bytes, updated_at) "
+                "VALUES (?, ?, 0, ?, 0, ?)",
+                (collection_name, namespace, chunk_count, datetime.now().isoformat())
+            )
+            self._conn.commit()
+
+    def _upsert_collection(self, namespace: str, collection_name: str, documents: int,
+                           chunks: int, size_bytes: int, now: str):
+        self._conn.execute(
+            "INSERT INTO collections "
+            "(collection_name, namespace, document_count, chunk_count, size_bytes, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(collection_name) DO UPDATE SET "
+            "document_count = document_count + excluded.document_count, "
+            "chunk_count = chunk_count + excluded.chunk_count, "
+            "size_bytes = size_bytes + excluded.size_bytes, "
+            "updated_at = excluded.updated_at",
+            (collection_name, namespace, documents, chunks, size_bytes, now)
+        )
+
+    def list_namespaces(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT namespace FROM collections ORDER BY namespace"
+            ).fetchall()
+        return [row["namespace"] for row in rows]
+
+    def list_collections(self, namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Collections with document/chunk counts, sizes and last-updated times"""
+        query = "SELECT * FROM collections"
+        params = ()
+        if namespace is not None:
+            query += " WHERE namespace = ?"
+            params = (namespace,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY collection_name", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_documents(self, namespace: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM documents WHERE namespace = ? ORDER BY ingested_at DESC",
+                (namespace,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def open_catalog(path: str) -> Optional[DocumentCatalog]:
+    """Open the document catalog, or return None if it cannot be opened"""
+    try:
+        return DocumentCatalog(path)
+    except Exception as e:
+        logger.error(f"Error opening document catalog at {path}: {e}")
+        return None
+
+
+_catalog: Optional[DocumentCatalog] = None
+_catalog_lock = threading.Lock()
+
+def get_catalog() -> Optional[DocumentCatalog]:
+    """Process-wide catalog; opening it does not load the kernel or its models"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = open_catalog(CATALOG_PATH)
+    return _catalog
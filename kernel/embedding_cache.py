@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from semantic_kernel.connectors.ai.embeddings.embedding_generator_base import EmbeddingGeneratorBase
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Normalise text so trivially different spellings share a cache entry"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """On-disk embedding cache keyed by (model id, normalised text hash) with LRU eviction"""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_id: str, text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{model_id}:{digest}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Return cached vectors for the given keys and refresh their LRU position"""
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        """Store vectors and evict the least recently used entries beyond max_entries"""
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (key, int(vector.shape[-1]), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in items.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+_embedding_executor: Optional[ThreadPoolExecutor] = None
+_embedding_executor_lock = threading.Lock()
+
+
+def get_embedding_executor(workers: int) -> ThreadPoolExecutor:
+    """Threads that run the embedding model, created on first use"""
+    global _embedding_executor
+    with _embedding_executor_lock:
+        if _embedding_executor is None:
+            _embedding_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embedding")
+        return _embedding_executor
+
+
+class ThreadedTextEmbedding(EmbeddingGeneratorBase):
+    """Runs the wrapped embedding service on the embedding executor.
+
+    HuggingFaceTextEmbedding.generate_embeddings is declared async but calls
+    SentenceTransformer.encode synchronously, which would stall the event loop
+    (and every chat request) for the length of each ingestion batch.
+    """
+
+    inner: Any
+    workers: int = 1
+
+    async def generate_embeddings(self, texts: List[str], **kwargs: Any) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_embedding_executor(self.workers),
+            lambda: asyncio.run(self.inner.generate_embeddings(texts, **kwargs))
+        )
+
+
+def wrap_in_thread(embedding_service, workers: int) -> ThreadedTextEmbedding:
+    return ThreadedTextEmbedding(
+        ai_model_id=embedding_service.ai_model_id,
+        service_id=embedding_service.service_id,
+        inner=embedding_service,
+        workers=workers
+    )
+
+
+class CachedTextEmbedding(EmbeddingGeneratorBase):
+    """Embedding service that consults an EmbeddingCache before calling the wrapped model"""
+
+    inner: Any
+    cache: Any
+
+    async def generate_embeddings(self, texts: List[str], **kwargs: Any) -> np.ndarray:
+        keys = [EmbeddingCache.make_key(self.ai_model_id, text) for text in texts]
+        # SQLite lookups and writes run off the event loop too
+        cached = await asyncio.to_thread(self.cache.get_many, keys)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            computed = await self.inner.generate_embeddings(list(missing.values()), **kwargs)
+            new_vectors = {
+                key: np.asarray(vector, dtype=np.float32)
+                for key, vector in zip(missing.keys(), computed)
+            }
+            await asyncio.to_thread(self.cache.put_many, new_vectors)
+            cached.update(new_vectors)
+
+        return np.stack([cached[key] for key in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+
+
+def wrap_with_cache(embedding_service, path: str, max_entries: int) -> Optional[CachedTextEmbedding]:
+    """Wrap an embedding service with a persistent cache, or return None if the cache cannot be opened"""
+    try:
+        cache = EmbeddingCache(path, max_entries)
+        return CachedTextEmbedding(
+            ai_model_id=embedding_service.ai_model_id,
+            service_id=embedding_service.service_id,
+            inner=embedding_service,
+            cache=cache
+        )
+    except Exception as e:
+        logger.error(f"Error opening embedding cache at {path}: {e}")
+        return None
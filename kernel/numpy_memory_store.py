@@ -0,0 +1,410 @@
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from semantic_kernel.memory.memory_record import MemoryRecord
+from semantic_kernel.memory.memory_store_base import MemoryStoreBase
+
+from utils import sanitize_collection_name
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per matrix multiply; bounds the float32 copy made of float16 blocks
+SEARCH_BLOCK_ROWS = 8192
+
+
+class _FlatIndex:
+    """One collection: a memory-mapped (capacity, dim) matrix of unit vectors plus a live-row mask"""
+
+    def __init__(self, path: str, dim: int, dtype: str, capacity: int, count: int, live_rows: List[int]):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self.count = count
+        self.vectors = self._open(capacity)
+        self.live = np.zeros(capacity, dtype=bool)
+        self.live[live_rows] = True
+
+    def _open(self, capacity: int) -> np.memmap:
+        mode = "r+" if os.path.exists(self.path) else "w+"
+        if mode == "r+":
+            expected = capacity * self.dim * self.dtype.itemsize
+            if os.path.getsize(self.path) < expected:
+                with open(self.path, "ab") as f:
+                    f.truncate(expected)
+        return np.memmap(self.path, dtype=self.dtype, mode=mode, shape=(capacity, self.dim))
+
+    def reserve(self, extra: int):
+        """Grow the backing file (doubling) so `extra` more rows fit"""
+        needed = self.count + extra
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, self.capacity * 2)
+        self.vectors.flush()
+        del self.vectors
+        with open(self.path, "ab") as f:
+            f.truncate(capacity * self.dim * self.dtype.itemsize)
+        self.vectors = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(capacity, self.dim))
+        live = np.zeros(capacity, dtype=bool)
+        live[:self.capacity] = self.live
+        self.live = live
+        self.capacity = capacity
+
+    def search(self, query: np.ndarray, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k rows by cosine similarity (vectors are stored normalised)"""
+        if self.count == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            block = self.vectors[start:min(start + SEARCH_BLOCK_ROWS, self.count)]
+            scores[start:start + len(block)] = block.astype(np.float32, copy=False) @ query
+        scores[~self.live[:self.count]] = -np.inf
+        k = min(limit, int(self.live[:self.count].sum()))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+
+class NumpyMemoryStore(MemoryStoreBase):
+    """Semantic Kernel memory store backed by memory-mapped NumPy matrices.
+
+    Each collection is a flat (exact) index: vectors live in `<root>/<collection>.vec`
+    and record metadata in a shared SQLite file. Top-k is a vectorised dot product,
+    which for collections of a few thousand chunks is cheaper than an HNSW store.
+    float16 halves the file size but every query upcasts the scanned rows.
+    """
+
+    def __init__(self, root: str, dtype: str = "float32"):
+        self.root = root
+        self.dtype = dtype
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS collections ("
+            "name TEXT PRIMARY KEY, dim INTEGER, dtype TEXT NOT NULL, "
+            "capacity INTEGER NOT NULL DEFAULT 0, count INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "collection TEXT NOT NULL, id TEXT NOT NULL, row INTEGER NOT NULL, "
+            "text TEXT, description TEXT, additional_metadata TEXT, timestamp TEXT, "
+            "PRIMARY KEY (collection, id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_row ON records(collection, row)")
+        self._conn.commit()
+        self._indexes: Dict[str, _FlatIndex] = {}
+
+    def _vector_path(self, collection_name: str) -> str:
+        return os.path.join(self.root, f"{collection_name}.vec")
+
+    def _index(self, collection_name: str, dim: Optional[int] = None) -> Optional[_FlatIndex]:
+        """Open (or, given a dimension, initialise) the flat index for a collection"""
+        index = self._indexes.get(collection_name)
+        if index is not None:
+            return index
+        row = self._conn.execute(
+            "SELECT dim, dtype, capacity, count FROM collections WHERE name = ?", (collection_name,)
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Collection {collection_name} does not exist")
+        stored_dim, dtype, capacity, count = row
+        if stored_dim is None:
+            if dim is None:
+                return None
+            capacity = max(1024, capacity)
+            self._conn.execute(
+                "UPDATE collections SET dim = ?, capacity = ? WHERE name = ?", (dim, capacity, collection_name)
+            )
+            stored_dim = dim
+        live_rows = [r[0] for r in self._conn.execute(
+            "SELECT row FROM records WHERE collection = ?", (collection_name,)
+        )]
+        index = _FlatIndex(self._vector_path(collection_name), stored_dim, dtype, capacity, count, live_rows)
+        self._indexes[collection_name] = index
+        return index
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def create_collection(self, collection_name: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO collections (name, dim, dtype) VALUES (?, NULL, ?)",
+                (collection_name, self.dtype)
+            )
+            self._conn.commit()
+
+    async def get_collections(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT name FROM collections ORDER BY name")]
+
+    async def delete_collection(self, collection_name: str) -> None:
+        with self._lock:
+            index = self._indexes.pop(collection_name, None)
+            if index is not None:
+                del index.vectors
+            self._conn.execute("DELETE FROM records WHERE collection = ?", (collection_name,))
+            self._conn.execute("DELETE FROM collections WHERE name = ?", (collection_name,))
+            self._conn.commit()
+            if os.path.exists(self._vector_path(collection_name)):
+                os.remove(self._vector_path(collection_name))
+
+    async def does_collection_exist(self, collection_name: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM collections WHERE name = ?", (collection_name,)
+            ).fetchone() is not None
+
+    async def upsert(self, collection_name: str, record: MemoryRecord) -> str:
+        return (await self.upsert_batch(collection_name, [record]))[0]
+
+    async def upsert_batch(self, collection_name: str, records: List[MemoryRecord]) -> List[str]:
+        if not records:
+            return []
+        vectors = np.stack([self._unit(record.embedding) for record in records])
+        with self._lock:
+            index = self._index(collection_name, dim=vectors.shape[1])
+            ids = [record.id for record in records]
+            existing = dict(self._conn.execute(
+                f"SELECT id, row FROM records WHERE collection = ? AND id IN ({','.join('?' * len(ids))})",
+                [collection_name, *ids]
+            ).fetchall())
+            index.reserve(sum(1 for record_id in dict.fromkeys(ids) if record_id not in existing))
+
+            rows = []
+            for record_id, vector in zip(ids, vectors):
+                row = existing.get(record_id)
+                if row is None:
+                    row = index.count
+                    index.count += 1
+                    existing[record_id] = row
+                index.vectors[row] = vector.astype(index.dtype)
+                index.live[row] = True
+                rows.append(row)
+            index.vectors.flush()
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO records "
+                "(collection, id, row, text, description, additional_metadata, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (collection_name, record.id, row, record.text, record.description,
+                     record.additional_metadata,
+                     str(record.timestamp) if getattr(record, "timestamp", None) else None)
+                    for record, row in zip(records, rows)
+                ]
+            )
+            self._conn.execute(
+                "UPDATE collections SET count = ?, capacity = ? WHERE name = ?",
+                (index.count, index.capacity, collection_name)
+            )
+            self._conn.commit()
+        return ids
+
+    async def get(self, collection_name: str, key: str, with_embedding: bool = False) -> Optional[MemoryRecord]:
+        records = await self.get_batch(collection_name, [key], with_embedding)
+        return records[0] if records else None
+
+    async def get_batch(self, collection_name: str, keys: List[str], with_embeddings: bool = False) -> List[MemoryRecord]:
+        if not keys:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, row, text, description, additional_metadata, timestamp FROM records "
+                f"WHERE collection = ? AND id IN ({','.join('?' * len(keys))})",
+                [collection_name, *keys]
+            ).fetchall()
+            index = self._index(collection_name) if with_embeddings and rows else None
+            return [self._to_record(row, index) for row in rows]
+
+    async def remove(self, collection_name: str, key: str) -> None:
+        await self.remove_batch(collection_name, [key])
+
+    async def remove_batch(self, collection_name: str, keys: List[str]) -> None:
+        if not keys:
+            return
+        with self._lock:
+            placeholders = ",".join("?" * len(keys))
+            rows = [r[0] for r in self._conn.execute(
+                f"SELECT row FROM records WHERE collection = ? AND id IN ({placeholders})",
+                [collection_name, *keys]
+            )]
+            index = self._index(collection_name)
+            if index is not None and rows:
+                index.live[rows] = False
+            self._conn.execute(
+                f"DELETE FROM records WHERE collection = ? AND id IN ({placeholders})",
+                [collection_name, *keys]
+            )
+            self._conn.commit()
+
+    async def get_nearest_matches(
+        self,
+        collection_name: str,
+        embedding: np.ndarray,
+        limit: int,
+        min_relevance_score: float = 0.0,
+        with_embeddings: bool = False,
+    ) -> List[Tuple[MemoryRecord, float]]:
+        query = self._unit(embedding)
+        with self._lock:
+            index = self._index(collection_name)
+            if index is None:
+                return []
+            top_rows, scores = index.search(query, limit)
+            keep = scores >= min_relevance_score
+            top_rows, scores = top_rows[keep], scores[keep]
+            if len(top_rows) == 0:
+                return []
+            rows = self._conn.execute(
+                "SELECT id, row, text, description, additional_metadata, timestamp FROM records "
+                f"WHERE collection = ? AND row IN ({','.join('?' * len(top_rows))})",
+                [collection_name, *[int(r) for r in top_rows]]
+            ).fetchall()
+            by_row = {row[1]: row for row in rows}
+            return [
+                (self._to_record(by_row[int(r)], index if with_embeddings else None), float(score))
+                for r, score in zip(top_rows, scores)
+                if int(r) in by_row
+            ]
+
+    async def get_nearest_match(
+        self,
+        collection_name: str,
+        embedding: np.ndarray,
+        min_relevance_score: float = 0.0,
+        with_embedding: bool = False,
+    ) -> Optional[Tuple[MemoryRecord, float]]:
+        matches = await self.get_nearest_matches(
+            collection_name, embedding, 1, min_relevance_score, with_embedding
+        )
+        return matches[0] if matches else None
+
+    async def persist(self) -> None:
+        """Flush every open vector file to disk"""
+        with self._lock:
+            for index in self._indexes.values():
+                index.vectors.flush()
+
+    async def count(self, collection_name: str) -> int:
+        """Number of live records in a collection"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM records WHERE collection = ?", (collection_name,)
+            ).fetchone()
+        return row[0]
+
+    @staticmethod
+    def _to_record(row, index: Optional[_FlatIndex]) -> MemoryRecord:
+        record_id, row_number, text, description, additional_metadata, timestamp = row
+        embedding = (
+            np.asarray(index.vectors[row_number], dtype=np.float32) if index is not None else np.array([])
+        )
+        return MemoryRecord.local_record(
+            id=record_id,
+            text=text,
+            description=description,
+            additional_metadata=additional_metadata,
+            embedding=embedding
+        )
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {
+                name: {"dim": dim, "count": count, "capacity": capacity}
+                for name, dim, count, capacity in self._conn.execute(
+                    "SELECT name, dim, count, capacity FROM collections"
+                )
+            }
+
+
+class NamespaceRoutedMemoryStore(MemoryStoreBase):
+    """Send the `documents_<namespace>` collections of selected namespaces to one store
+    (typically NumpyMemoryStore) and every other collection to the default store."""
+
+    def __init__(self, default_store: MemoryStoreBase, routed_store: MemoryStoreBase, namespaces: List[str]):
+        self.default_store = default_store
+        self.routed_store = routed_store
+        # Same naming as ingestion, which creates collections under their sanitized names
+        self.routed_collections = {sanitize_collection_name(f"documents_{namespace}") for namespace in namespaces}
+
+    def _store(self, collection_name: str) -> MemoryStoreBase:
+        return self.routed_store if collection_name in self.routed_collections else self.default_store
+
+    async def create_collection(self, collection_name: str) -> None:
+        await self._store(collection_name).create_collection(collection_name)
+
+    async def get_collections(self) -> List[str]:
+        routed = await self.routed_store.get_collections()
+        default = await self.default_store.get_collections()
+        return sorted(set(routed) | set(default))
+
+    async def delete_collection(self, collection_name: str) -> None:
+        await self._store(collection_name).delete_collection(collection_name)
+
+    async def does_collection_exist(self, collection_name: str) -> bool:
+        return await self._store(collection_name).does_collection_exist(collection_name)
+
+    async def upsert(self, collection_name: str, record: MemoryRecord) -> str:
+        return await self._store(collection_name).upsert(collection_name, record)
+
+    async def upsert_batch(self, collection_name: str, records: List[MemoryRecord]) -> List[str]:
+        return await self._store(collection_name).upsert_batch(collection_name, records)
+
+    async def get(self, collection_name: str, key: str, with_embedding: bool = False) -> Optional[MemoryRecord]:
+        return await self._store(collection_name).get(collection_name, key, with_embedding)
+
+    async def get_batch(self, collection_name: str, keys: List[str], with_embeddings: bool = False) -> List[MemoryRecord]:
+        return await self._store(collection_name).get_batch(collection_name, keys, with_embeddings)
+
+    async def remove(self, collection_name: str, key: str) -> None:
+        await self._store(collection_name).remove(collection_name, key)
+
+    async def remove_batch(self, collection_name: str, keys: List[str]) -> None:
+        await self._store(collection_name).remove_batch(collection_name, keys)
+
+    async def get_nearest_matches(
+        self,
+        collection_name: str,
+        embedding: np.ndarray,
+        limit: int,
+        min_relevance_score: float = 0.0,
+        with_embeddings: bool = False,
+    ) -> List[Tuple[MemoryRecord, float]]:
+        return await self._store(collection_name).get_nearest_matches(
+            collection_name, embedding, limit, min_relevance_score, with_embeddings
+        )
+
+    async def get_nearest_match(
+        self,
+        collection_name: str,
+        embedding: np.ndarray,
+        min_relevance_score: float = 0.0,
+        with_embedding: bool = False,
+    ) -> Optional[Tuple[MemoryRecord, float]]:
+        return await self._store(collection_name).get_nearest_match(
+            collection_name, embedding, min_relevance_score, with_embedding
+        )
+
+    async def persist(self) -> None:
+        for store in (self.default_store, self.routed_store):
+            if hasattr(store, "persist"):
+                await store.persist()
+
+    async def count(self, collection_name: str) -> int:
+        store = self._store(collection_name)
+        if hasattr(store, "count"):
+            return await store.count(collection_name)
+        collection = await store.get_collection(collection_name)
+        return collection.count() if collection else 0
@@ -39,7 +39,7 @@ class ConversationPlugin:
         try:
             # Get text completion service with proper settings
             text_completion = kernel.get_service("text_completion")
-            prompt = self.conversation_template.replace("{{$state}}", state).replace("{{$collected_data}}", collected_data).replace("{{$next_field}}", next_field).replace("{{$user_message}}", user_message).replace("{{$conversation_context}}", conversation_context)
+            prompt = self._build_prompt(state, collected_data, next_field, user_message, conversation_context)
             
             # Create proper settings for the API call
             settings = OllamaPromptExecutionSettings()
@@ -48,4 +48,8 @@ class ConversationPlugin:
             return str(result)
         except Exception as e:
             logger.error(f"Error generating response: {e}")
-            return "عذراً، حدث خطأ في معالجة طلبك. يرجى المحاولة مرة أخرى."
\ No newline at end of file
+            return "عذراً، حدث خطأ في معالجة طلبك. يرجى المحاولة مرة أخرى."
+
+    def _build_prompt(self, state: str, collected_data: str, next_field: str,
+                      user_message: str, conversation_context: str) -> str:
+        return self.conversation_template.replace("{{$state}}", state).replace("{{$collected_data}}", collected_data).replace("{{$next_field}}", next_field).replace("{{$user_message}}", user_message).replace("{{$conversation_context}}", conversation_context)
\ No newline at end of file
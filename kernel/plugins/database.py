@@ -1,7 +1,11 @@
 from semantic_kernel.functions import kernel_function
 from semantic_kernel.connectors.ai.ollama import OllamaPromptExecutionSettings
 import json ,logging,uuid
-from models import SessionLocal ,RequestStatus , ServiceRequestModel
+from typing import Dict, Any
+from datetime import datetime
+from models import AsyncSessionLocal ,RequestStatus , ServiceRequestModel
+from request_writer import request_writer, WriteBehindQueueFull
+from utils import count_new_requests
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,7 +19,7 @@ class DatabasePlugin:
         description="Create a new service request in database",
         name="create_request"
     )
-    def create_service_request(
+    async def create_service_request(
         self,
         service_name: str,
         user_data: str,
@@ -25,13 +29,27 @@ class DatabasePlugin:
         """Create service request using existing database functions"""
         try:
             user_data_dict = json.loads(user_data) if isinstance(user_data, str) else user_data
-            
-            db = SessionLocal()
-            
+        except json.JSONDecodeError as e:
+            logger.error(f"Error creating service request: {e}")
+            return json.dumps({
+                "status": "error",
+                "message": f"خطأ في إرسال الطلب: {str(e)}"
+            })
+        return json.dumps(await self.create_request_record(service_name, user_data_dict, session_id, namespace))
+    
+    async def create_request_record(
+        self,
+        service_name: str,
+        user_data: Dict[str, Any],
+        session_id: str,
+        namespace: str = "default"
+    ) -> Dict[str, Any]:
+        """Typed in-process variant of create_request (no JSON round trip)"""
+        try:
             # إنشاء البيانات للطلب
             request_data = {
                 "service_name": service_name,
-                "user_data": user_data_dict,
+                "user_data": user_data,
                 "session_id": session_id,
                 "namespace": namespace
             }
@@ -46,20 +64,46 @@ class DatabasePlugin:
                 namespace=request_data.get("namespace", "default"),
                 status=RequestStatus.PENDING
             )
-            db.add(db_request)
-            db.commit()
-            db.refresh(db_request)
-            db.close()
+            if request_writer and request_writer.running:
+                # Write-behind: confirm now, the row is inserted with the next batch
+                now = datetime.now()
+                try:
+                    request_writer.submit({
+                        "request_id": request_id,
+                        "service_name": db_request.service_name,
+                        "user_data": db_request.user_data,
+                        "session_id": db_request.session_id,
+                        "namespace": db_request.namespace,
+                        "status": RequestStatus.PENDING.value,
+                        "created_at": now,
+                        "updated_at": now
+                    })
+                    return {
+                        "status": "success",
+                        "request_id": request_id,
+                        "message": f"تم إرسال طلبك بنجاح! رقم الطلب: {request_id}"
+                    }
+                except WriteBehindQueueFull as queue_error:
+                    logger.warning(f"{queue_error}; inserting request {request_id} directly")
             
-            return json.dumps({
+            async with AsyncSessionLocal() as db:
+                db.add(db_request)
+                await count_new_requests(db, [{
+                    "service_name": db_request.service_name,
+                    "status": db_request.status,
+                    "created_at": datetime.now()
+                }])
+                await db.commit()
+            
+            return {
                 "status": "success",
                 "request_id": db_request.request_id,
                 "message": f"تم إرسال طلبك بنجاح! رقم الطلب: {db_request.request_id}"
-            })
+            }
             
         except Exception as e:
             logger.error(f"Error creating service request: {e}")
-            return json.dumps({
+            return {
                 "status": "error",
                 "message": f"خطأ في إرسال الطلب: {str(e)}"
-            })
\ No newline at end of file
+            }
\ No newline at end of file
@@ -1,20 +1,72 @@
 from semantic_kernel.functions import kernel_function
-from semantic_kernel.connectors.memory.chroma import ChromaMemoryStore
-from semantic_kernel.memory.semantic_text_memory import SemanticTextMemory
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import TextLoader, PyPDFLoader, UnstructuredFileLoader
 import semantic_kernel as sk
-import json ,logging ,uuid
+import asyncio ,json ,logging ,hashlib
 from pathlib import Path
-from config import CHROMA_BASE_PATH
+from typing import Dict, Any, List
+from config import CHROMA_BASE_PATH, INGEST_BATCH_SIZE
 from utils import sanitize_collection_name
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def make_chunk_id(text: str) -> str:
+    """Content-addressed chunk ID: identical chunk text always maps to the same ID"""
+    return f"chunk_{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+def parse_document(file_path: str) -> List[str]:
+    """Load a document and split it into text chunks (CPU-bound, runs off the event loop)"""
+    # langchain is heavy; import it only when a document is parsed
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.document_loaders import TextLoader, PyPDFLoader, UnstructuredFileLoader
+
+    # Determine file type and load accordingly
+    file_extension = Path(file_path).suffix.lower()
+
+    if file_extension == '.pdf':
+        loader = PyPDFLoader(file_path)
+    elif file_extension == '.txt':
+        loader = TextLoader(file_path, encoding='utf-8')
+    else:
+        loader = UnstructuredFileLoader(file_path)
+
+    # Load and split document
+    documents = loader.load()
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200
+    )
+    return [doc.page_content for doc in text_splitter.split_documents(documents)]
+
 class DocumentPlugin:
-    def __init__(self):
-        pass
+    def __init__(self, memory_store=None, catalog=None, service_builder=None):
+        # Shared store from SemanticKernelConfig; opened per call only as a fallback
+        self.memory_store = memory_store
+        self.catalog = catalog
+        self.service_builder = service_builder
+        self.change_listeners = []
+
+    def add_change_listener(self, listener):
+        """Register listener(namespace, collection_name), called after new chunks are written"""
+        self.change_listeners.append(listener)
+
+    def notify_changed(self, namespace: str, collection_name: str):
+        for listener in self.change_listeners:
+            try:
+                listener(namespace, collection_name)
+            except Exception as listener_error:
+                logger.warning(f"Document change listener failed: {listener_error}")
+
+    async def refresh_services(self, namespace: str, texts: List[str], progress=None) -> int:
+        """Add the services described in newly stored chunks to the namespace's service catalog"""
+        if not self.service_builder or not texts:
+            return 0
+        if progress is not None:
+            progress.stage = "services"
+        try:
+            return await self.service_builder.build(namespace, texts)
+        except Exception as service_error:
+            logger.warning(f"Service extraction failed for namespace {namespace}: {service_error}")
+            return 0
 
     @kernel_function(
         description="Process and store uploaded documents in semantic memory",
@@ -25,93 +77,286 @@ class DocumentPlugin:
         file_path: str,
         namespace: str,
         collection_name: str,
+        batch_size: int = INGEST_BATCH_SIZE,
+        file_hash: str = "",
+        file_size: int = 0,
         kernel: sk.Kernel = None
     ) -> str:
         """Process uploaded document and add to semantic memory with persistence"""
+        result = await self.ingest(
+            file_path=file_path,
+            namespace=namespace,
+            collection_name=collection_name,
+            embedding_service=kernel.get_service("embedding_service"),
+            batch_size=batch_size,
+            file_hash=file_hash,
+            file_size=file_size
+        )
+        return json.dumps(result)
+
+    async def ingest(
+        self,
+        file_path: str,
+        namespace: str,
+        collection_name: str,
+        embedding_service,
+        batch_size: int = INGEST_BATCH_SIZE,
+        file_hash: str = "",
+        file_size: int = 0,
+        progress=None
+    ) -> Dict[str, Any]:
+        """Parse a file and store its chunks; `progress` (if given) has its counters updated as work proceeds"""
         try:
             collection_name = sanitize_collection_name(collection_name)
-            
-            # Determine file type and load accordingly
-            file_extension = Path(file_path).suffix.lower()
-            
-            if file_extension == '.pdf':
-                loader = PyPDFLoader(file_path)
-            elif file_extension == '.txt':
-                loader = TextLoader(file_path, encoding='utf-8')
-            else:
-                loader = UnstructuredFileLoader(file_path)
-            
-            # Load and split document
-            documents = loader.load()
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200
-            )
-            texts = text_splitter.split_documents(documents)
-            
-            # Get the embedding service and create semantic memory
-            embedding_service = kernel.get_service("embedding_service")
-            
-            # Create persistent memory store
-            memory_store = ChromaMemoryStore(persist_directory=CHROMA_BASE_PATH)
-            semantic_memory = SemanticTextMemory(
-                storage=memory_store,
-                embeddings_generator=embedding_service
-            )
-            
-            # Ensure collection exists
-            try:
-                await memory_store.create_collection(collection_name)
-                logger.info(f"Collection {collection_name} created or verified")
-            except Exception as collection_error:
-                logger.warning(f"Collection creation note: {collection_error}")
-            
-            # Add texts to semantic memory with unique IDs
-            chunks_processed = 0
-            for i, text in enumerate(texts):
-                try:
-                    unique_id = f"{Path(file_path).stem}_{i}_{uuid.uuid4().hex[:8]}"
-                    await semantic_memory.save_information(
-                        collection=collection_name,
-                        text=text.page_content,
-                        id=unique_id,
-                        description=f"Document chunk {i+1} from {Path(file_path).name}"
-                    )
-                    chunks_processed += 1
-                    logger.info(f"Saved chunk {i+1}/{len(texts)} with ID: {unique_id}")
-                except Exception as chunk_error:
-                    logger.warning(f"Failed to save chunk {i}: {chunk_error}")
-                    continue
-            
-            # Force persistence by calling persist if available
-            try:
-                if hasattr(memory_store, 'persist'):
-                    await memory_store.persist()
-                    logger.info("Memory store persisted successfully")
-            except Exception as persist_error:
-                logger.warning(f"Persistence warning: {persist_error}")
-            
-            if chunks_processed > 0:
-                return json.dumps({
+            file_name = Path(file_path).name
+
+            # Skip files whose exact content was already ingested, without parsing them
+            if file_hash and self.catalog and self.catalog.has_document(collection_name, file_hash):
+                logger.info(f"File {file_name} ({file_hash[:12]}) already ingested into {collection_name}")
+                return {
                     "status": "success",
-                    "message": f"تم رفع ومعالجة {chunks_processed} جزء من الملف بنجاح في المجموعة {collection_name}",
-                    "chunks_processed": chunks_processed,
-                    "total_chunks": len(texts),
-                    "file_name": Path(file_path).name,
+                    "message": f"الملف موجود مسبقاً في المجموعة {collection_name}، لم تتم إعادة معالجته",
+                    "duplicate_file": True,
+                    "chunks_processed": 0,
+                    "chunks_new": 0,
+                    "chunks_skipped": 0,
+                    "total_chunks": 0,
+                    "file_name": file_name,
                     "collection_name": collection_name,
                     "namespace": namespace
-                })
-            else:
-                return json.dumps({
-                    "status": "partial_error",
-                    "message": "تم معالجة الملف لكن لم يتم حفظ أي أجزاء",
-                    "chunks_processed": 0,
-                    "total_chunks": len(texts)
-                })
-                
+                }
+
+            # Parsing is CPU-bound; keep it off the event loop
+            if progress is not None:
+                progress.stage = "parsing"
+            texts = await asyncio.to_thread(parse_document, file_path)
+            if progress is not None:
+                progress.chunks_parsed = len(texts)
+
+            return await self.store_texts(
+                texts=texts,
+                file_name=file_name,
+                namespace=namespace,
+                collection_name=collection_name,
+                embedding_service=embedding_service,
+                batch_size=batch_size,
+                file_hash=file_hash,
+                file_size=file_size,
+                progress=progress
+            )
+
         except Exception as e:
             logger.error(f"Error processing document: {e}")
-            return json.dumps({
+            return {
                 "status": "error",
                 "message": f"خطأ في معالجة الملف: {str(e)}"
-            })
\ No newline at end of file
+            }
+
+    async def store_texts(
+        self,
+        texts: List[str],
+        file_name: str,
+        namespace: str,
+        collection_name: str,
+        embedding_service,
+        batch_size: int = INGEST_BATCH_SIZE,
+        file_hash: str = "",
+        file_size: int = 0,
+        progress=None
+    ) -> Dict[str, Any]:
+        """Embed and upsert the already parsed chunks of one file"""
+        if progress is not None:
+            progress.stage = "embedding"
+        batcher = await self.create_batcher(collection_name, embedding_service, batch_size, progress)
+        await batcher.add(file_name, file_name, texts)
+        await batcher.flush()
+        stats = batcher.files[file_name]
+        chunks_processed = stats["chunks_new"]
+        chunks_skipped = stats["chunks_skipped"]
+        failed_batches = batcher.failed_batches
+
+        await self.persist(batcher.memory_store)
+        if chunks_processed > 0:
+            self.notify_changed(namespace, collection_name)
+
+        if self.catalog:
+            if file_hash and not failed_batches:
+                self.catalog.record_document(
+                    namespace, collection_name, file_hash, file_name,
+                    size_bytes=file_size, chunk_count=stats["unique_chunks"], new_chunks=chunks_processed
+                )
+            elif chunks_processed:
+                self.catalog.add_chunks(namespace, collection_name, chunks_processed)
+
+        services_catalogued = await self.refresh_services(namespace, batcher.new_texts, progress)
+
+        if chunks_processed > 0 or (chunks_skipped > 0 and not failed_batches):
+            return {
+                "status": "success",
+                "message": f"تم رفع ومعالجة {chunks_processed} جزء جديد من الملف بنجاح في المجموعة {collection_name} (تم تخطي {chunks_skipped} جزء موجود مسبقاً)",
+                "chunks_processed": chunks_processed,
+                "chunks_new": chunks_processed,
+                "chunks_skipped": chunks_skipped,
+                "total_chunks": len(texts),
+                "failed_batches": failed_batches,
+                "services_catalogued": services_catalogued,
+                "file_name": file_name,
+                "collection_name": collection_name,
+                "namespace": namespace
+            }
+        else:
+            return {
+                "status": "partial_error",
+                "message": "تم معالجة الملف لكن لم يتم حفظ أي أجزاء",
+                "chunks_processed": 0,
+                "chunks_new": 0,
+                "chunks_skipped": chunks_skipped,
+                "total_chunks": len(texts),
+                "failed_batches": failed_batches
+            }
+
+    async def create_batcher(self, collection_name: str, embedding_service,
+                             batch_size: int = INGEST_BATCH_SIZE, progress=None) -> "EmbeddingBatcher":
+        """Ensure the collection exists and return a batcher writing into it"""
+        from semantic_kernel.connectors.memory.chroma import ChromaMemoryStore
+
+        # Reuse the shared persistent memory store
+        memory_store = self.memory_store or ChromaMemoryStore(persist_directory=CHROMA_BASE_PATH)
+
+        # Ensure collection exists
+        try:
+            await memory_store.create_collection(collection_name)
+            logger.info(f"Collection {collection_name} created or verified")
+        except Exception as collection_error:
+            logger.warning(f"Collection creation note: {collection_error}")
+
+        return EmbeddingBatcher(self, memory_store, embedding_service, collection_name, batch_size, progress)
+
+    async def persist(self, memory_store):
+        """Force persistence by calling persist if available"""
+        try:
+            if hasattr(memory_store, 'persist'):
+                await memory_store.persist()
+                logger.info("Memory store persisted successfully")
+        except Exception as persist_error:
+            logger.warning(f"Persistence warning: {persist_error}")
+
+    async def _existing_ids(self, memory_store, collection_name: str, chunk_ids: list) -> set:
+        """Return which of the given chunk IDs are already stored in the collection"""
+        records = await memory_store.get_batch(collection_name, chunk_ids, with_embeddings=False)
+        return {record.id for record in records}
+
+    async def _save_batch(self, memory_store, embedding_service, collection_name: str, batch: list, progress=None):
+        """Embed a batch of (id, text, description) chunks in one call and upsert them together"""
+        from semantic_kernel.memory.memory_record import MemoryRecord
+
+        embeddings = await embedding_service.generate_embeddings([text for _, text, _ in batch])
+        if progress is not None:
+            progress.chunks_embedded += len(batch)
+        records = [
+            MemoryRecord.local_record(
+                id=chunk_id,
+                text=text,
+                description=description,
+                additional_metadata=None,
+                embedding=embedding
+            )
+            for (chunk_id, text, description), embedding in zip(batch, embeddings)
+        ]
+        await memory_store.upsert_batch(collection_name, records)
+        if progress is not None:
+            progress.chunks_written += len(batch)
+
+
+class EmbeddingBatcher:
+    """Accumulates chunks from one or more files and embeds/upserts them in fixed-size batches.
+
+    Chunk IDs are content hashes, so chunks seen earlier in the run or already
+    stored in the collection are skipped. Per-file counters are kept in `files`.
+    """
+
+    def __init__(self, plugin: DocumentPlugin, memory_store, embedding_service, collection_name: str,
+                 batch_size: int = INGEST_BATCH_SIZE, progress=None):
+        self.plugin = plugin
+        self.memory_store = memory_store
+        self.embedding_service = embedding_service
+        self.collection_name = collection_name
+        self.batch_size = max(1, int(batch_size))
+        self.progress = progress
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.failed_batches: List[Dict[str, Any]] = []
+        # Text of every chunk written by this batcher, in order
+        self.new_texts: List[str] = []
+        self._pending = []
+        self._seen_ids = set()
+        self._batch_index = 0
+
+    async def add(self, file_key: str, file_name: str, texts: List[str]):
+        """Queue the chunks of one file, flushing every full batch"""
+        stats = self.files.setdefault(file_key, {
+            "file_name": file_name,
+            "total_chunks": 0,
+            "unique_chunks": 0,
+            "chunks_new": 0,
+            "chunks_skipped": 0,
+            "chunks_failed": 0
+        })
+        stats["total_chunks"] += len(texts)
+        if self.progress is not None:
+            self.progress.total_chunks += len(texts)
+
+        for i, text in enumerate(texts):
+            chunk_id = make_chunk_id(text)
+            if chunk_id in self._seen_ids:
+                self._mark_skipped(stats, 1)
+                continue
+            self._seen_ids.add(chunk_id)
+            stats["unique_chunks"] += 1
+            self._pending.append((file_key, chunk_id, text, f"Document chunk {i+1} from {file_name}"))
+            if len(self._pending) >= self.batch_size:
+                await self._flush_batch()
+
+    async def flush(self):
+        """Write every chunk still pending"""
+        while self._pending:
+            await self._flush_batch()
+
+    def _mark_skipped(self, stats: Dict[str, Any], count: int):
+        stats["chunks_skipped"] += count
+        if self.progress is not None:
+            self.progress.chunks_skipped += count
+
+    async def _flush_batch(self):
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        self._batch_index += 1
+        try:
+            existing_ids = await self.plugin._existing_ids(
+                self.memory_store, self.collection_name, [chunk_id for _, chunk_id, _, _ in batch]
+            )
+            new_chunks = [c for c in batch if c[1] not in existing_ids]
+            if new_chunks:
+                await self.plugin._save_batch(
+                    self.memory_store, self.embedding_service, self.collection_name,
+                    [(chunk_id, text, description) for _, chunk_id, text, description in new_chunks],
+                    self.progress
+                )
+            self.new_texts.extend(text for _, _, text, _ in new_chunks)
+            for file_key, chunk_id, _, _ in batch:
+                if chunk_id in existing_ids:
+                    self._mark_skipped(self.files[file_key], 1)
+                else:
+                    self.files[file_key]["chunks_new"] += 1
+            logger.info(
+                f"Batch {self._batch_index} in {self.collection_name}: "
+                f"{len(new_chunks)} new, {len(batch) - len(new_chunks)} already present"
+            )
+        except Exception as batch_error:
+            logger.warning(f"Failed to save batch {self._batch_index}: {batch_error}")
+            for file_key, _, _, _ in batch:
+                self.files[file_key]["chunks_failed"] += 1
+            self.failed_batches.append({
+                "batch_index": self._batch_index,
+                "chunk_count": len(batch),
+                "files": sorted({self.files[file_key]["file_name"] for file_key, _, _, _ in batch}),
+                "error": str(batch_error)
+            })
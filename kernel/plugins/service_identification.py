@@ -25,6 +25,24 @@ class ServiceIdentificationPlugin:
           "estimated_processing_time": "المدة المتوقعة للمعالجة"
         }
         """
+        self.extraction_template = """
+        أنت محلل لوثائق الخدمات الحكومية والإدارية.
+
+        استخرج جميع الخدمات الموصوفة في النص التالي مع الحقول المطلوبة من المتقدم لكل خدمة.
+        لا تخترع خدمات غير مذكورة في النص.
+
+        النص: {{$document_text}}
+
+        أجب بتنسيق JSON فقط كقائمة (قائمة فارغة [] إذا لم توجد خدمات):
+        [
+          {
+            "service_name": "اسم الخدمة",
+            "required_fields": ["الحقل1", "الحقل2"],
+            "description": "وصف مختصر للخدمة",
+            "estimated_processing_time": "المدة المتوقعة للمعالجة"
+          }
+        ]
+        """
     
     @kernel_function(
         description="Identify the specific government service requested by the user",
@@ -50,10 +68,37 @@ class ServiceIdentificationPlugin:
         
         except Exception as e:
             logger.error(f"Error getting text completion service: {e}")
-            return json.dumps({
+            return self._error_result(e)
+
+    @kernel_function(
+        description="Extract the government services described in a document excerpt",
+        name="extract_services"
+    )
+    async def extract_services(
+        self,
+        document_text: str,
+        kernel: sk.Kernel = None
+    ) -> str:
+        """Return a JSON list of the services (with their required fields) found in the text"""
+        try:
+            text_completion = kernel.get_service("text_completion")
+            prompt = self.extraction_template.replace("{{$document_text}}", document_text)
+            settings = OllamaPromptExecutionSettings()
+            
+            result = await text_completion.get_text_content(prompt, settings)
+            return str(result)
+        
+        except Exception as e:
+            logger.error(f"Error extracting services: {e}")
+            return "[]"
+
+    def _error_result(self, e: Exception) -> str:
+        # "error" marks the result as a failure, so callers do not cache it as an identification
+        return json.dumps({
                 "service_name": "غير محدد",
                 "confidence": "منخفض",
                 "required_fields": [],
                 "description": f"خطأ في تحديد الخدمة: {str(e)}",
-                "estimated_processing_time": "غير محدد"
+                "estimated_processing_time": "غير محدد",
+                "error": str(e)
             })
\ No newline at end of file
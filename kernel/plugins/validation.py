@@ -1,53 +1,160 @@
 import json
 import re
-from datetime import datetime
+from datetime import date
+from typing import Callable, Dict, Optional
 from semantic_kernel.functions import kernel_function
 from config import VALIDATION_PATTERNS
 
+# Arabic-Indic and Eastern Arabic-Indic digits -> ASCII
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+_DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_WHITESPACE = re.compile(r"\s+")
+
+NORMALIZERS: Dict[str, Callable[[str], str]] = {
+    "digits": lambda value: re.sub(r"[\s-]", "", value.translate(_DIGITS)),
+    "date": lambda value: value.translate(_DIGITS),
+    "lower": lambda value: value.lower(),
+    "spaces": lambda value: _WHITESPACE.sub(" ", value),
+}
+
+
+class FieldValidator:
+    """Compiled validation rule for one field: normalisation, pattern and optional date check"""
+
+    def __init__(self, field_name: str, pattern: Optional[str] = None, message: str = "",
+                 normalize: Optional[str] = None, is_date: bool = False, allow_future: bool = False):
+        self.field_name = field_name
+        self.pattern = re.compile(pattern) if pattern else None
+        self.message = message
+        self.normalizer = NORMALIZERS.get(normalize)
+        self.is_date = is_date
+        self.allow_future = allow_future
+
+    def normalize(self, value: str) -> str:
+        value = value.strip() if value else ""
+        return self.normalizer(value) if self.normalizer else value
+
+    def validate(self, value: str) -> tuple[bool, str, str]:
+        """Returns: (is_valid, error_message, normalised value)"""
+        value = self.normalize(value)
+        if not value:
+            return False, f"{self.field_name} مطلوب", value
+
+        if self.pattern and not self.pattern.match(value):
+            return False, self.message, value
+
+        if self.is_date:
+            if not _DATE_PATTERN.match(value):
+                return False, "تاريخ غير صحيح، استخدم صيغة YYYY-MM-DD", value
+            try:
+                parsed = date.fromisoformat(value)
+            except ValueError:
+                return False, "تاريخ غير صحيح، استخدم صيغة YYYY-MM-DD", value
+            if not self.allow_future and parsed > date.today():
+                return False, "التاريخ لا يمكن أن يكون في المستقبل", value
+
+        return True, "", value
+
+
+class ValidatorRegistry:
+    """Field validators compiled once from VALIDATION_PATTERNS.
+
+    Fields without a pattern get a required-value check, plus the date check
+    when the field name mentions a date (تاريخ).
+    """
+
+    def __init__(self, patterns: Dict[str, Dict[str, str]]):
+        self._validators: Dict[str, FieldValidator] = {
+            field_name: self._build(field_name, rule) for field_name, rule in patterns.items()
+        }
+
+    @staticmethod
+    def _build(field_name: str, rule: Dict[str, str]) -> FieldValidator:
+        return FieldValidator(
+            field_name,
+            pattern=rule.get("pattern"),
+            message=rule.get("message", ""),
+            normalize=rule.get("normalize"),
+            is_date=rule.get("type") == "date" or "تاريخ" in field_name,
+            allow_future=bool(rule.get("allow_future", False))
+        )
+
+    def get(self, field_name: str) -> FieldValidator:
+        validator = self._validators.get(field_name)
+        if validator is None:
+            # Not cached: field names come from users and LLM output, so the registry would grow
+            # without bound. A default validator has no pattern to compile and is cheap to build.
+            validator = self._build(field_name, {})
+        return validator
+
+    def validate(self, field_name: str, value: str) -> tuple[bool, str, str]:
+        return self.get(field_name).validate(value)
+
+    def validate_form(self, fields: Dict[str, str]) -> Dict:
+        """Validate every field of a form and collect all errors at once"""
+        errors = {}
+        values = {}
+        for field_name, value in fields.items():
+            is_valid, error_message, normalized = self.validate(field_name, "" if value is None else str(value))
+            values[field_name] = normalized
+            if not is_valid:
+                errors[field_name] = error_message
+        return {
+            "is_valid": not errors,
+            "errors": errors,
+            "values": values
+        }
+
+
+validator_registry = ValidatorRegistry(VALIDATION_PATTERNS)
+
+
 class ValidationPlugin:
-    def __init__(self):
-        pass
-    
+    def __init__(self, registry: ValidatorRegistry = validator_registry):
+        self.registry = registry
+
+    def check(self, field_name: str, value: str) -> tuple[bool, str, str]:
+        """Typed in-process variant of validate_field: (is_valid, error_message, normalised value)"""
+        return self.registry.validate(field_name, value)
+
     @kernel_function(
         description="Validate user input based on field type and patterns",
         name="validate_field"
     )
     def validate_field(self, field_name: str, value: str) -> str:
         """Validate input using existing validation patterns"""
-        is_valid, error_message = self._validate_input(field_name, value)
-        
+        is_valid, error_message, normalized = self.check(field_name, value)
+
         return json.dumps({
             "is_valid": is_valid,
             "error_message": error_message,
             "field_name": field_name,
-            "value": value.strip() if value else ""
+            "value": normalized
         })
-    
+
+    @kernel_function(
+        description="Validate a whole form of fields (JSON object of field name to value) and return all errors",
+        name="validate_form"
+    )
+    def validate_form(self, fields: str) -> str:
+        """Validate several fields in one call"""
+        try:
+            data = json.loads(fields)
+            if not isinstance(data, dict):
+                raise ValueError("fields must be a JSON object")
+        except ValueError as e:
+            return json.dumps({
+                "is_valid": False,
+                "errors": {"fields": f"صيغة الحقول غير صحيحة: {str(e)}"},
+                "values": {}
+            })
+
+        return json.dumps(self.registry.validate_form(data))
+
     def _validate_input(self, field_name: str, value: str) -> tuple[bool, str]:
         """
         Validate user input based on field type
         Returns: (is_valid, error_message)
         """
-        if not value or not value.strip():
-            return False, f"{field_name} مطلوب"
-        
-        value = value.strip()
-        
-        # Check if field has validation pattern
-        if field_name in VALIDATION_PATTERNS:
-            pattern = VALIDATION_PATTERNS[field_name]["pattern"]
-            message = VALIDATION_PATTERNS[field_name]["message"]
-            
-            if not re.match(pattern, value):
-                return False, message
-        
-        # Additional custom validations
-        if "تاريخ" in field_name:
-            try:
-                date_obj = datetime.strptime(value, "%Y-%m-%d")
-                if date_obj > datetime.now():
-                    return False, "التاريخ لا يمكن أن يكون في المستقبل"
-            except ValueError:
-                return False, "تاريخ غير صحيح، استخدم صيغة YYYY-MM-DD"
-        
-        return True, ""
\ No newline at end of file
+        is_valid, error_message, _ = self.registry.validate(field_name, value)
+        return is_valid, error_message
@@ -0,0 +1,80 @@
+import copy
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceSemanticCache:
+    """Namespace-scoped cache of identify_service results keyed by message embedding.
+
+    A lookup returns the stored service JSON of the most similar earlier message
+    when the cosine similarity reaches `threshold`. Entries expire after
+    `ttl_seconds` and a namespace is cleared when its documents change.
+    """
+
+    def __init__(self, threshold: float, ttl_seconds: float, max_entries: int):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # namespace -> list of (unit vector, service data, created_at, message)
+        self._entries: Dict[str, List[tuple]] = {}
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, namespace: str, embedding) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached service data for a similar message, or None"""
+        query = self._unit(embedding)
+        now = time.time()
+        with self._lock:
+            entries = [e for e in self._entries.get(namespace, []) if now - e[2] < self.ttl_seconds]
+            self._entries[namespace] = entries
+            if entries:
+                similarities = np.stack([e[0] for e in entries]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.hits += 1
+                    logger.info(
+                        f"Service cache hit in {namespace} (similarity {similarities[best]:.3f}) "
+                        f"for message similar to: {entries[best][3][:50]}"
+                    )
+                    return copy.deepcopy(entries[best][1])
+            self.misses += 1
+        return None
+
+    def store(self, namespace: str, embedding, service_data: Dict[str, Any], message: str = ""):
+        with self._lock:
+            entries = self._entries.setdefault(namespace, [])
+            entries.append((self._unit(embedding), copy.deepcopy(service_data), time.time(), message))
+            if len(entries) > self.max_entries:
+                del entries[:len(entries) - self.max_entries]
+
+    def invalidate(self, namespace: str):
+        """Drop every cached result for a namespace (its documents changed)"""
+        with self._lock:
+            if self._entries.pop(namespace, None):
+                logger.info(f"Service cache invalidated for namespace: {namespace}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = {namespace: len(items) for namespace, items in self._entries.items()}
+        lookups = self.hits + self.misses
+        return {
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
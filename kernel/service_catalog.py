@@ -0,0 +1,203 @@
+import json
+import logging
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import SERVICE_CATALOG_PATH, SERVICE_EXTRACTION_CHARS
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceCatalog:
+    """Per-namespace catalog of service definitions with their embeddings.
+
+    Filled once at ingestion time from the uploaded documents, so identifying a
+    service is a nearest-neighbour lookup instead of an LLM call.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS services (
+                namespace TEXT NOT NULL,
+                service_name TEXT NOT NULL,
+                required_fields TEXT NOT NULL,
+                description TEXT NOT NULL DEFAULT '',
+                estimated_processing_time TEXT NOT NULL DEFAULT '',
+                embedding BLOB NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (namespace, service_name)
+            )
+            """
+        )
+        self._conn.commit()
+        # namespace -> (services, unit embedding matrix), rebuilt after writes
+        self._matrices: Dict[str, Tuple[List[Dict[str, Any]], np.ndarray]] = {}
+
+    def upsert_services(self, namespace: str, services: List[Dict[str, Any]], embeddings):
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO services "
+                "(namespace, service_name, required_fields, description, estimated_processing_time, embedding, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        namespace,
+                        service["service_name"],
+                        json.dumps(service["required_fields"], ensure_ascii=False),
+                        service.get("description", ""),
+                        service.get("estimated_processing_time", ""),
+                        np.asarray(embedding, dtype=np.float32).tobytes(),
+                        now
+                    )
+                    for service, embedding in zip(services, embeddings)
+                ]
+            )
+            self._conn.commit()
+            self._matrices.pop(namespace, None)
+
+    def list_services(self, namespace: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(service) for service in self._load(namespace)[0]]
+
+    def match(self, namespace: str, embedding) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Most similar catalogued service and its cosine similarity, or None for an empty namespace"""
+        query = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        with self._lock:
+            services, matrix = self._load(namespace)
+            if not services:
+                return None
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            return dict(services[best]), float(similarities[best])
+
+    def _load(self, namespace: str) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        if namespace not in self._matrices:
+            rows = self._conn.execute(
+                "SELECT * FROM services WHERE namespace = ? ORDER BY service_name", (namespace,)
+            ).fetchall()
+            services = [
+                {
+                    "service_name": row["service_name"],
+                    "required_fields": json.loads(row["required_fields"]),
+                    "description": row["description"],
+                    "estimated_processing_time": row["estimated_processing_time"]
+                }
+                for row in rows
+            ]
+            matrix = np.stack([np.frombuffer(row["embedding"], dtype=np.float32) for row in rows]) if rows else np.empty((0, 0), dtype=np.float32)
+            if len(matrix):
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                matrix = matrix / np.where(norms == 0, 1, norms)
+            self._matrices[namespace] = (services, matrix)
+        return self._matrices[namespace]
+
+
+def parse_services(result: str) -> List[Dict[str, Any]]:
+    """Parse the extract_services JSON list, dropping malformed entries"""
+    match = re.search(r"\[.*\]", result, re.DOTALL)
+    if not match:
+        return []
+    try:
+        items = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return []
+    services = []
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        name = str(item.get("service_name", "")).strip()
+        fields = item.get("required_fields")
+        if not name or not isinstance(fields, list):
+            continue
+        services.append({
+            "service_name": name,
+            "required_fields": [str(field).strip() for field in fields if str(field).strip()],
+            "description": str(item.get("description", "")),
+            "estimated_processing_time": str(item.get("estimated_processing_time", ""))
+        })
+    return services
+
+
+class ServiceCatalogBuilder:
+    """Extracts service definitions from newly ingested chunks and adds them to the catalog"""
+
+    def __init__(self, catalog: ServiceCatalog, kernel, embedding_service, max_chars: int = SERVICE_EXTRACTION_CHARS):
+        self.catalog = catalog
+        self.kernel = kernel
+        self.embedding_service = embedding_service
+        self.max_chars = max_chars
+
+    def _windows(self, texts: List[str]) -> List[str]:
+        """Group consecutive chunks into prompts of at most max_chars"""
+        windows, current = [], ""
+        for text in texts:
+            if current and len(current) + len(text) > self.max_chars:
+                windows.append(current)
+                current = ""
+            current = f"{current}\n\n{text}" if current else text
+        if current:
+            windows.append(current)
+        return windows
+
+    async def build(self, namespace: str, texts: List[str]) -> int:
+        """Extract services from the given chunks; returns how many were catalogued"""
+        from semantic_kernel.functions.kernel_arguments import KernelArguments
+
+        services: Dict[str, Dict[str, Any]] = {}
+        for window in self._windows(texts):
+            result = await self.kernel.invoke(
+                plugin_name="service_id",
+                function_name="extract_services",
+                arguments=KernelArguments(document_text=window, kernel=self.kernel)
+            )
+            for service in parse_services(str(result)):
+                # A service described across windows keeps its most detailed definition
+                known = services.get(service["service_name"])
+                if known is None or len(service["required_fields"]) > len(known["required_fields"]):
+                    services[service["service_name"]] = service
+        if not services:
+            return 0
+
+        entries = list(services.values())
+        embeddings = await self.embedding_service.generate_embeddings(
+            [f"{service['service_name']}\n{service['description']}" for service in entries]
+        )
+        self.catalog.upsert_services(namespace, entries, embeddings)
+        logger.info(f"Catalogued {len(entries)} services for namespace {namespace}")
+        return len(entries)
+
+
+def open_service_catalog(path: str) -> Optional[ServiceCatalog]:
+    """Open the service catalog, or return None if it cannot be opened"""
+    try:
+        return ServiceCatalog(path)
+    except Exception as e:
+        logger.error(f"Error opening service catalog at {path}: {e}")
+        return None
+
+
+_service_catalog: Optional[ServiceCatalog] = None
+_service_catalog_lock = threading.Lock()
+
+def get_service_catalog() -> Optional[ServiceCatalog]:
+    global _service_catalog
+    if _service_catalog is None:
+        with _service_catalog_lock:
+            if _service_catalog is None:
+                _service_catalog = open_service_catalog(SERVICE_CATALOG_PATH)
+    return _service_catalog
@@ -1,12 +1,18 @@
+import asyncio
 import logging
+import threading
+import time
 import semantic_kernel as sk
-from semantic_kernel.connectors.ai.ollama import OllamaTextCompletion
-from semantic_kernel.connectors.ai.hugging_face import HuggingFaceTextEmbedding
-from semantic_kernel.connectors.memory.chroma import ChromaMemoryStore
-from semantic_kernel.memory.semantic_text_memory import SemanticTextMemory
-from semantic_kernel.core_plugins.text_memory_plugin import TextMemoryPlugin
 
-from config import CHROMA_BASE_PATH
+from config import (
+    CHROMA_BASE_PATH, EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_WORKERS,
+    SERVICE_CACHE_ENABLED, SERVICE_CACHE_THRESHOLD, SERVICE_CACHE_TTL_SECONDS, SERVICE_CACHE_MAX_ENTRIES,
+    COLLECTIONS_CACHE_TTL_SECONDS, VECTOR_STORE_BACKEND, NUMPY_STORE_PATH, NUMPY_STORE_DTYPE,
+    NUMPY_STORE_NAMESPACES, SERVICE_CATALOG_ENABLED
+)
+from startup import startup_report
+from dispatch_metrics import function_timing_filter
+from .catalog import get_catalog
 from .plugins.service_identification import ServiceIdentificationPlugin
 from .plugins.validation import ValidationPlugin
 from .plugins.database import DatabasePlugin
@@ -15,34 +21,118 @@ from .plugins.document import DocumentPlugin
 
 logger = logging.getLogger(__name__)
 
+_shared_config = None
+_shared_config_lock = threading.Lock()
+
 class SemanticKernelConfig:
     def __init__(self):
         self.kernel = sk.Kernel()
-        
-        self.text_completion_service = OllamaTextCompletion(
-            ai_model_id="granite3.3",
-            service_id="text_completion"
-        )
-        self.kernel.add_service(self.text_completion_service)
+        self.add_filters()
+        self._collections_cache = None
+        self._collections_cached_at = 0.0
 
-        self.embedding_service = HuggingFaceTextEmbedding(
-            ai_model_id="all-MiniLM-L6-v2",
-            service_id="embedding_service"
-        )
-        self.kernel.add_service(self.embedding_service)
+        # Setup AI services
+        self.load_services()
         
         # Setup Memory
-        self.setup_memory()
+        with startup_report.phase("vector store open"):
+            self.setup_memory()
+        
+        # Catalog of ingested source documents
+        self.catalog = get_catalog()
+        
+        # Semantic cache of identify_service results
+        self.service_cache = None
+        if SERVICE_CACHE_ENABLED:
+            from .semantic_cache import ServiceSemanticCache
+            self.service_cache = ServiceSemanticCache(
+                SERVICE_CACHE_THRESHOLD, SERVICE_CACHE_TTL_SECONDS, SERVICE_CACHE_MAX_ENTRIES
+            )
+        
+        # Service definitions extracted from documents at ingestion time
+        self.service_catalog = None
+        self.service_catalog_builder = None
+        if SERVICE_CATALOG_ENABLED:
+            from .service_catalog import get_service_catalog, ServiceCatalogBuilder
+            self.service_catalog = get_service_catalog()
+            if self.service_catalog:
+                self.service_catalog_builder = ServiceCatalogBuilder(
+                    self.service_catalog, self.kernel, self.embedding_service
+                )
         
         # Register Plugins
-        self.register_plugins()
+        with startup_report.phase("plugins"):
+            self.register_plugins()
+
+    def add_filters(self):
+        """Time each kernel function invocation for the per-turn dispatch metrics"""
+        try:
+            from semantic_kernel.filters.filter_types import FilterTypes
+            self.kernel.add_filter(FilterTypes.FUNCTION_INVOCATION, function_timing_filter)
+        except Exception as e:
+            logger.warning(f"Could not register function timing filter: {e}")
+
+    def load_services(self):
+        """Create the text completion and embedding services"""
+        # Connector imports pull in torch/transformers, so they are deferred until first use
+        with startup_report.phase("kernel imports"):
+            from semantic_kernel.connectors.ai.ollama import OllamaTextCompletion
+            from semantic_kernel.connectors.ai.hugging_face import HuggingFaceTextEmbedding
+
+        with startup_report.phase("model load"):
+            self.text_completion_service = OllamaTextCompletion(
+                ai_model_id="granite3.3",
+                service_id="text_completion"
+            )
+            self.kernel.add_service(self.text_completion_service)
+
+            from .embedding_cache import wrap_in_thread
+            # Encoding runs on its own threads so ingestion batches do not block chat requests
+            self.embedding_service = wrap_in_thread(HuggingFaceTextEmbedding(
+                ai_model_id="all-MiniLM-L6-v2",
+                service_id="embedding_service"
+            ), EMBEDDING_WORKERS)
+
+            # Put the persistent embedding cache in front of the model for ingestion and retrieval
+            self.embedding_cache = None
+            if EMBEDDING_CACHE_ENABLED:
+                from .embedding_cache import wrap_with_cache
+                cached_service = wrap_with_cache(
+                    self.embedding_service, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+                )
+                if cached_service:
+                    self.embedding_service = cached_service
+                    self.embedding_cache = cached_service.cache
+            self.kernel.add_service(self.embedding_service)
     
+    def create_memory_store(self):
+        """Create the configured vector store (Chroma, the numpy flat index, or Chroma with
+        selected namespaces routed to the flat index)"""
+        if VECTOR_STORE_BACKEND == "numpy":
+            from .numpy_memory_store import NumpyMemoryStore
+            logger.info(f"Using numpy flat-index memory store at: {NUMPY_STORE_PATH}")
+            return NumpyMemoryStore(NUMPY_STORE_PATH, dtype=NUMPY_STORE_DTYPE)
+
+        from semantic_kernel.connectors.memory.chroma import ChromaMemoryStore
+        chroma_store = ChromaMemoryStore(persist_directory=CHROMA_BASE_PATH)
+        if not NUMPY_STORE_NAMESPACES:
+            return chroma_store
+
+        from .numpy_memory_store import NumpyMemoryStore, NamespaceRoutedMemoryStore
+        logger.info(f"Routing namespaces {NUMPY_STORE_NAMESPACES} to the numpy flat-index memory store")
+        return NamespaceRoutedMemoryStore(
+            chroma_store,
+            NumpyMemoryStore(NUMPY_STORE_PATH, dtype=NUMPY_STORE_DTYPE),
+            NUMPY_STORE_NAMESPACES
+        )
+
     def setup_memory(self):
-        """Setup semantic memory with persistent Chroma"""
+        """Setup persistent semantic memory"""
         try:
-            self.memory_store = ChromaMemoryStore(
-                persist_directory=CHROMA_BASE_PATH
-            )
+            from semantic_kernel.memory.semantic_text_memory import SemanticTextMemory
+            from semantic_kernel.core_plugins.text_memory_plugin import TextMemoryPlugin
+
+            self.memory_store = self.create_memory_store()
             
             self.semantic_memory = SemanticTextMemory(
                 storage=self.memory_store,
@@ -52,16 +142,91 @@ class SemanticKernelConfig:
             memory_plugin = TextMemoryPlugin(memory=self.semantic_memory)
             self.kernel.add_plugin(memory_plugin, "memory")
             
-            logger.info(f"Persistent semantic memory setup completed at: {CHROMA_BASE_PATH}")
+            logger.info(f"Persistent semantic memory setup completed ({VECTOR_STORE_BACKEND} backend)")
             
         except Exception as e:
             logger.error(f"Error setting up memory: {e}")
+            self.memory_store = None
             self.semantic_memory = None
 
     def register_plugins(self):
         """Register all plugins with the kernel"""
         self.kernel.add_plugin(ServiceIdentificationPlugin(), "service_id")
-        self.kernel.add_plugin(ValidationPlugin(), "validation")
-        self.kernel.add_plugin(DatabasePlugin(), "database")
+        # Kept as attributes for the agent's direct-call fast path
+        self.validation_plugin = ValidationPlugin()
+        self.database_plugin = DatabasePlugin()
+        self.kernel.add_plugin(self.validation_plugin, "validation")
+        self.kernel.add_plugin(self.database_plugin, "database")
         self.kernel.add_plugin(ConversationPlugin(), "conversation")
-        self.kernel.add_plugin(DocumentPlugin(), "document")
\ No newline at end of file
+        self.document_plugin = DocumentPlugin(
+            memory_store=self.memory_store,
+            catalog=self.catalog,
+            service_builder=self.service_catalog_builder
+        )
+        self.kernel.add_plugin(self.document_plugin, "document")
+        self.document_plugin.add_change_listener(self.on_documents_changed)
+
+    async def get_collections(self) -> list:
+        """List memory collections, cached until an upload/delete invalidates it (or the TTL passes)"""
+        if not self.memory_store:
+            return []
+        if (
+            self._collections_cache is None
+            or time.monotonic() - self._collections_cached_at > COLLECTIONS_CACHE_TTL_SECONDS
+        ):
+            self._collections_cache = list(await self.memory_store.get_collections())
+            self._collections_cached_at = time.monotonic()
+        return list(self._collections_cache)
+
+    async def sync_catalog(self):
+        """Register vector store collections that predate the catalog (documents_<namespace> naming)"""
+        if not self.catalog or not self.memory_store:
+            return
+        known = {c["collection_name"] for c in self.catalog.list_collections()}
+        for collection_name in await self.get_collections():
+            if collection_name in known:
+                continue
+            namespace = collection_name[len("documents_"):] if collection_name.startswith("documents_") else collection_name
+            chunk_count = 0
+            try:
+                if hasattr(self.memory_store, "count"):
+                    chunk_count = await self.memory_store.count(collection_name)
+                else:
+                    collection = await self.memory_store.get_collection(collection_name)
+                    chunk_count = collection.count() if collection else 0
+            except Exception as count_error:
+                logger.warning(f"Could not count chunks in {collection_name}: {count_error}")
+            self.catalog.register_collection(namespace, collection_name, chunk_count)
+            logger.info(f"Catalogued existing collection {collection_name} ({chunk_count} chunks)")
+
+    def invalidate_collections(self):
+        """Forget the cached collection list (call after creating or deleting a collection)"""
+        self._collections_cache = None
+
+    def on_documents_changed(self, namespace: str, collection_name: str):
+        """Drop cached state that depends on a namespace's documents"""
+        self.invalidate_collections()
+        if self.service_cache:
+            self.service_cache.invalidate(namespace)
+
+def get_kernel_config() -> SemanticKernelConfig:
+    """Return the process-wide SemanticKernelConfig, creating it on first use.
+
+    The kernel, model services, memory store and plugins are loaded once and
+    shared by every agent and endpoint. Per-call state travels in
+    KernelArguments, so the shared instance is safe to use concurrently.
+    """
+    global _shared_config
+    if _shared_config is None:
+        with _shared_config_lock:
+            if _shared_config is None:
+                logger.info("Initializing shared Semantic Kernel configuration")
+                _shared_config = SemanticKernelConfig()
+    return _shared_config
+
+async def get_kernel_config_async() -> SemanticKernelConfig:
+    """get_kernel_config for coroutines: the first call loads the models and the
+    memory store in a worker thread, so the event loop keeps serving requests"""
+    if _shared_config is not None:
+        return _shared_config
+    return await asyncio.to_thread(get_kernel_config)
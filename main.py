@@ -1,20 +1,42 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query
-from fastapi.responses import JSONResponse
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Depends, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Dict, Any, Optional
-from semantic_kernel.functions.kernel_arguments import KernelArguments
-from kernel.setup import SemanticKernelConfig
-from semantic_kernel.connectors.memory.chroma import ChromaMemoryStore
-import os
+from kernel.setup import get_kernel_config_async
+from kernel.catalog import get_catalog
+from kernel.service_catalog import get_service_catalog
+from kernel.plugins.validation import validator_registry
+import uuid
+import asyncio
 import logging
 from pathlib import Path
 from datetime import datetime
-import aiofiles ,json
-from semantic_kernel.contents import AuthorRole
-from config import CHROMA_BASE_PATH
-from models import ChatMessage, ChatResponse, RequestStatusUpdate ,SessionLocal ,RequestStatus , ServiceRequestModel
+import json
+from config import (
+    PRELOAD_KERNEL_ON_STARTUP, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE, MAX_BATCH_FILES, SERVICE_CATALOG_ENABLED, PLUGIN_FAST_PATH,
+    MAX_BATCH_UPLOAD_BYTES, UPLOAD_FORM_OVERHEAD_BYTES,
+    STATS_CACHE_TTL_SECONDS, BULK_STATUS_MAX_REQUESTS, SESSION_TTL_SECONDS, SESSION_HISTORY_MESSAGES,
+    SESSION_STORE_BACKEND, SESSION_MAX_SESSIONS, SESSION_MAX_MEMORY_MB, SESSION_SWEEP_SECONDS,
+    CHROMA_BASE_PATH, NUMPY_STORE_PATH
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import ChatMessage, ChatResponse, FormValidationRequest, RequestStatusUpdate, BulkStatusUpdate, RequestStatus , AsyncSessionLocal, get_db, init_db, dispose_db
 from agent.service_agent import SemanticKernelServiceAgent
-from utils import sanitize_collection_name, get_request_by_id, get_requests_paginated, update_request_status
+from utils import (
+    sanitize_collection_name, save_upload_stream, UploadTooLargeError, StatusUpdateConflictError, get_request_by_id, get_requests_page,
+    count_requests, InvalidCursorError, update_request_status, bulk_update_request_status, get_request_stats, rebuild_request_counters
+)
+from startup import startup_report
+from dispatch_metrics import dispatch_stats
+from request_writer import request_writer
+from request_export import RequestExport, ExportDependencyError
+from session_store import session_store, LiveSessionCache, encode_session
+from ingestion import IngestionJob, BatchIngestionJob, IngestionQueueFull, ingestion_queue, shutdown_parse_pool
+
+startup_report.record("imports", time.perf_counter() - _import_started)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -34,31 +56,182 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-chat_sessions: Dict[str, Dict[str, Any]] = {}
+# Largest request body accepted by each upload endpoint
+UPLOAD_BODY_LIMITS = {
+    "/upload": MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD_BYTES,
+    "/upload/batch": MAX_BATCH_UPLOAD_BYTES,
+}
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject oversized uploads from their Content-Length, before the multipart body is
+    spooled to a temporary file. Chunked uploads without a Content-Length are still
+    limited per file by save_upload_stream, but only after the body has been received."""
+    limit = UPLOAD_BODY_LIMITS.get(request.url.path) if request.method == "POST" else None
+    if limit is not None:
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"حجم الطلب يتجاوز الحد المسموح ({limit} بايت)"}
+            )
+    return await call_next(request)
+
+# Live sessions when no external session store is configured (SESSION_STORE_BACKEND=memory)
+chat_sessions = LiveSessionCache(
+    SESSION_MAX_SESSIONS, SESSION_MAX_MEMORY_MB * 1024 * 1024, SESSION_TTL_SECONDS, SESSION_SWEEP_SECONDS
+)
+
+# Registers vector store collections that predate the document catalog, when started with an empty catalog
+catalog_sync_task: Optional[asyncio.Task] = None
+
+async def sync_existing_collections():
+    """Load the kernel off the event loop, then register collections missing from the catalog"""
+    try:
+        kernel_config = await get_kernel_config_async()
+        await kernel_config.sync_catalog()
+        logger.info("Registered existing vector store collections in the catalog")
+    except Exception as e:
+        logger.error(f"Error synchronizing catalog: {e}")
+
+def has_vector_data() -> bool:
+    return any(Path(path).is_dir() and any(Path(path).iterdir()) for path in (CHROMA_BASE_PATH, NUMPY_STORE_PATH))
+
+@app.on_event("startup")
+async def on_startup():
+    """Check the DB schema and optionally warm up the kernel, timing each phase"""
+    with startup_report.phase("db schema"):
+        try:
+            await init_db()
+            # One-off backfill of the /stats counters for tables that predate them
+            async with AsyncSessionLocal() as db:
+                if await rebuild_request_counters(db):
+                    logger.info("Rebuilt request counters from service_requests")
+        except Exception as e:
+            logger.error(f"Error checking database schema: {e}")
+    
+    global catalog_sync_task
+    if PRELOAD_KERNEL_ON_STARTUP:
+        await (await get_kernel_config_async()).sync_catalog()
+    else:
+        catalog = get_catalog()
+        if catalog and not catalog.list_collections() and has_vector_data():
+            catalog_sync_task = asyncio.create_task(sync_existing_collections())
+    
+    if session_store:
+        logger.warning(
+            f"Chat sessions are shared through the {SESSION_STORE_BACKEND} store, but ingestion jobs, "
+            "write-behind pending rows and the stats, collection and service caches are still per worker"
+        )
+    ingestion_queue.start()
+    chat_sessions.start(session_store)
+    if request_writer:
+        await request_writer.start()
+    startup_report.log_summary()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Stop background workers"""
+    if catalog_sync_task and not catalog_sync_task.done():
+        catalog_sync_task.cancel()
+    await ingestion_queue.stop()
+    await chat_sessions.stop()
+    shutdown_parse_pool()
+    # Flush (or spool) requests still waiting in the write-behind queue before closing the pool
+    if request_writer:
+        await request_writer.stop()
+    await dispose_db()
+    if session_store:
+        await session_store.close()
+
+@app.get("/startup")
+async def get_startup_report():
+    """Get the time spent in each startup phase"""
+    return startup_report.as_dict()
+
+def session_record(session: Dict[str, Any], history_limit: Optional[int] = SESSION_HISTORY_MESSAGES) -> Dict[str, Any]:
+    """A session in its stored form: the agent's state plus the activity counters"""
+    return {
+        "agent": session['agent'].to_state(history_limit),
+        "created_at": session['created_at'].isoformat(),
+        "last_activity": session['last_activity'].isoformat(),
+        "message_count": session['message_count']
+    }
+
+async def get_session(message: ChatMessage) -> Dict[str, Any]:
+    """Get (or create) the session of a chat message and record the activity.
+    With an external session store the agent is rebuilt from its stored state,
+    so any worker can continue any conversation."""
+    session = None
+    if session_store is None:
+        session = chat_sessions.get(message.session_id)
+    else:
+        record = await session_store.get(message.session_id)
+        if record:
+            session = {
+                'agent': SemanticKernelServiceAgent.from_state(record['agent'], sk_config=await get_kernel_config_async()),
+                'created_at': datetime.fromisoformat(record['created_at']),
+                'last_activity': datetime.fromisoformat(record['last_activity']),
+                'message_count': record['message_count']
+            }
+    
+    # Create session with chat history if doesn't exist
+    if session is None:
+        session = {
+            'agent': SemanticKernelServiceAgent(
+                message.session_id, message.namespace, sk_config=await get_kernel_config_async()
+            ),
+            'created_at': datetime.now(),
+            'last_activity': datetime.now(),
+            'message_count': 0
+        }
+        if session_store is None:
+            chat_sessions.put(message.session_id, session, session_record(session, history_limit=None))
+    
+    # Update session activity
+    session['last_activity'] = datetime.now()
+    session['message_count'] += 1
+    
+    return session
+
+async def save_session(session_id: str, session: Dict[str, Any]):
+    """Write the session back to the external store, or re-measure the live in-memory session"""
+    if session_store is None:
+        chat_sessions.put(session_id, session, session_record(session, history_limit=None))
+    else:
+        await session_store.set(session_id, session_record(session), SESSION_TTL_SECONDS)
+
+async def end_session(session_id: str):
+    chat_sessions.pop(session_id)
+    if session_store is not None:
+        await session_store.delete(session_id)
+
+async def iter_session_records():
+    """(session_id, stored-form record, size in bytes) of every live session: the
+    approximate memory of in-memory sessions, or the serialised size in the store"""
+    if session_store is None:
+        for session_id, session in chat_sessions.items():
+            yield session_id, session_record(session, history_limit=None), chat_sessions.size_of(session_id)
+    else:
+        async for session_id, record in session_store.scan():
+            yield session_id, record, len(encode_session(record))
+
+def format_sse(event: str, data: Any) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(message: ChatMessage):
     """Enhanced chat endpoint with Semantic Kernel ChatHistory"""
     try:
-        # Create session with chat history if doesn't exist
-        if message.session_id not in chat_sessions:
-            chat_sessions[message.session_id] = {
-                'agent': SemanticKernelServiceAgent(message.session_id, message.namespace),
-                'created_at': datetime.now(),
-                'last_activity': datetime.now(),
-                'message_count': 0
-            }
-        
-        # Update session activity
-        chat_sessions[message.session_id]['last_activity'] = datetime.now()
-        chat_sessions[message.session_id]['message_count'] += 1
-        
-        agent = chat_sessions[message.session_id]['agent']
-        response = await agent.process_message(message.message)
+        session = await get_session(message)
+        response = await session['agent'].process_message(message.message)
         
         # Clean up completed sessions
         if response.completed:
-            del chat_sessions[message.session_id]
+            await end_session(message.session_id)
+        else:
+            await save_session(message.session_id, session)
         
         return response
         
@@ -70,22 +243,63 @@ async def chat_endpoint(message: ChatMessage):
         )
     
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(message: ChatMessage):
+    """Chat endpoint reporting a turn's progress as Server-Sent Events.
+    Emits `progress` events while slow steps run (service identification), the
+    `reply` text, then structured events (service_identified, next_field,
+    validation_error, completed) and a final `response`."""
+    async def event_stream():
+        session = None
+        completed = False
+        try:
+            session = await get_session(message)
+            async for event, data in session['agent'].process_message_stream(message.message):
+                if event == "response" and data.get("completed"):
+                    # Clean up completed sessions
+                    completed = True
+                    await end_session(message.session_id)
+                yield format_sse(event, data)
+        except Exception as e:
+            logger.error(f"Error in chat stream endpoint: {e}")
+            yield format_sse("error", {
+                "response": f"❌ خطأ في المعالجة: {str(e)}",
+                "status": "error"
+            })
+        finally:
+            # Also when the client disconnects mid-stream
+            if session is not None and not completed:
+                await save_session(message.session_id, session)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/requests")
 async def get_requests(
-    page: int = Query(1, ge=1),
+    cursor: Optional[str] = None,
     limit: int = Query(10, ge=1, le=100),
     status: Optional[RequestStatus] = None,
-    service_name: Optional[str] = None
+    service_name: Optional[str] = None,
+    namespace: Optional[str] = None,
+    session_id: Optional[str] = None,
+    total: str = Query("approximate", pattern="^(approximate|exact|none)$"),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get paginated service requests with filters"""
+    """Get service requests newest first, one cursor page at a time.
+    Pass the returned `next_cursor` to get the following page; `total` selects
+    how the total is computed (counter tables, COUNT(*) scan, or not at all).
+    `service_name` matches any part of the name, ignoring Arabic spelling variants."""
     try:
-        db = SessionLocal()
-        skip = (page - 1) * limit
-        requests, total = get_requests_paginated(
-            db, skip=skip, limit=limit, 
-            status=status, service_name=service_name
-        )
-        db.close()
+        filters = {"status": status, "service_name": service_name, "namespace": namespace, "session_id": session_id}
+        requests, next_cursor = await get_requests_page(db, cursor=cursor, limit=limit, **filters)
+        # The counters have no namespace/session dimension; those filters are always counted exactly
+        total_is_estimate = total == "approximate" and not (namespace or session_id)
+        total_count = None
+        if total != "none":
+            total_count = await count_requests(db, exact=not total_is_estimate, **filters)
         
         return {
             "requests": [
@@ -102,16 +316,85 @@ async def get_requests(
                     "notes": req.notes
                 } for req in requests
             ],
-            "total": total,
-            "page": page,
+            "next_cursor": next_cursor,
             "limit": limit,
-            "total_pages": (total + limit - 1) // limit
+            "total": total_count,
+            "total_is_estimate": total_is_estimate
         }
         
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting requests: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.get("/requests/export")
+async def export_requests(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|parquet)$"),
+    status: Optional[RequestStatus] = None,
+    service_name: Optional[str] = None,
+    namespace: Optional[str] = None,
+    session_id: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    flatten: bool = False,
+    user_data_keys: Optional[List[str]] = Query(None)
+):
+    """Stream every request matching the filters as NDJSON, CSV or Parquet.
+    `flatten` turns user_data into user_data.<field> columns; `user_data_keys`
+    picks those columns instead of discovering them with an extra pass."""
+    filters = {
+        "status": status, "service_name": service_name, "namespace": namespace,
+        "session_id": session_id, "created_after": created_after, "created_before": created_before
+    }
+    try:
+        export = RequestExport(format, filters, flatten=flatten, user_data_keys=user_data_keys)
+    except ExportDependencyError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    
+    return StreamingResponse(
+        export.stream(),
+        media_type=export.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{export.filename}"'}
+    )
+
+ALLOWED_UPLOAD_EXTENSIONS = {'.pdf', '.txt', '.docx', '.doc'}
+
+async def save_temp_upload(file: UploadFile, namespace: str, timestamp: str):
+    """Validate an uploaded file and stream it to temp/<namespace>.
+    Returns (file_path, size_bytes, sha256); raises HTTPException on bad type or size."""
+    # Validate file type
+    file_extension = Path(file.filename).suffix.lower()
+    
+    if file_extension not in ALLOWED_UPLOAD_EXTENSIONS:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"نوع الملف غير مدعوم ({file.filename}). الأنواع المدعومة: {', '.join(ALLOWED_UPLOAD_EXTENSIONS)}"
+        )
+    
+    # Create namespace directory for temporary files
+    temp_dir = Path("temp") / namespace
+    temp_dir.mkdir(parents=True, exist_ok=True)
+    
+    # Save uploaded file temporarily
+    safe_filename = f"{timestamp}_{uuid.uuid4().hex[:8]}_{Path(file.filename).name}"
+    file_path = temp_dir / safe_filename
+    
+    # Stream to disk in fixed-size chunks, hashing and enforcing the size limit on the fly
+    try:
+        file_size, file_hash = await save_upload_stream(
+            file, file_path, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE
+        )
+    except UploadTooLargeError as size_error:
+        file_path.unlink(missing_ok=True)
+        raise HTTPException(
+            status_code=413,
+            detail=f"حجم الملف يتجاوز الحد المسموح ({MAX_UPLOAD_BYTES} بايت): {size_error}"
+        )
+    
+    logger.info(f"File saved temporarily: {file_path} ({file_size} bytes, sha256 {file_hash[:12]})")
+    return file_path, file_size, file_hash
+
 @app.post("/upload")
 async def upload_file(
     file: UploadFile = File(...),
@@ -119,78 +402,46 @@ async def upload_file(
 ):
     """Upload and process documents for semantic memory with improved persistence"""
     try:
-        # Validate file type
-        allowed_extensions = {'.pdf', '.txt', '.docx', '.doc'}
-        file_extension = Path(file.filename).suffix.lower()
-        
-        if file_extension not in allowed_extensions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"نوع الملف غير مدعوم. الأنواع المدعومة: {', '.join(allowed_extensions)}"
-            )
-        
-        # Create namespace directory for temporary files
-        temp_dir = Path("temp") / namespace
-        temp_dir.mkdir(parents=True, exist_ok=True)
-
         # تحديد اسم المجموعة وتنظيفه
         raw_collection_name = f"documents_{namespace}"
         collection_name = sanitize_collection_name(raw_collection_name)
         
-        # Save uploaded file temporarily
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_filename = f"{timestamp}_{file.filename}"
-        file_path = temp_dir / safe_filename
-        
-        async with aiofiles.open(file_path, 'wb') as buffer:
-            content = await file.read()
-            await buffer.write(content)
-        
-        logger.info(f"File saved temporarily: {file_path}")
+        file_path, file_size, file_hash = await save_temp_upload(file, namespace, timestamp)
         
-        # Initialize Semantic Kernel for processing
-        sk_config = SemanticKernelConfig()
-        
-        # Process document using DocumentPlugin
-        arguments = KernelArguments(
+        # Queue the document for background processing and return immediately
+        job = IngestionJob(
             file_path=str(file_path),
+            file_name=file.filename,
             namespace=namespace,
             collection_name=collection_name,
-            kernel=sk_config.kernel
+            file_hash=file_hash,
+            file_size=file_size
         )
-        
-        result = await sk_config.kernel.invoke(
-            plugin_name="document",
-            function_name="process_document",
-            arguments=arguments
-        )
-        
-        processing_result = json.loads(str(result))
-        
-        # Clean up temporary file
         try:
-            file_path.unlink()
-            logger.info(f"Temporary file cleaned up: {file_path}")
-        except Exception as cleanup_error:
-            logger.warning(f"Could not clean up temporary file: {cleanup_error}")
-        
-        # Verify the collection was created
-        try:
-            memory_store = ChromaMemoryStore(persist_directory=CHROMA_BASE_PATH)
-            collections = await memory_store.get_collections()
-            logger.info(f"Collections after upload: {collections}")
-        except Exception as verify_error:
-            logger.warning(f"Could not verify collections: {verify_error}")
+            ingestion_queue.submit(job)
+        except IngestionQueueFull as queue_error:
+            raise HTTPException(
+                status_code=503,
+                detail=f"قائمة المعالجة ممتلئة، يرجى المحاولة لاحقاً: {queue_error}"
+            )
         
         return {
-            "message": "تم رفع الملف ومعالجته بنجاح",
+            "message": "تم رفع الملف وجدولته للمعالجة",
+            "job_id": job.job_id,
+            "status": job.status,
             "filename": file.filename,
             "namespace": namespace,
             "collection_name": collection_name,
-            "processing_result": processing_result,
+            "file_hash": file_hash,
+            "size_bytes": file_size,
             "timestamp": timestamp
         }
         
+    except HTTPException:
+        if 'file_path' in locals() and file_path.exists():
+            file_path.unlink(missing_ok=True)
+        raise
     except Exception as e:
         logger.error(f"Error uploading file: {e}")
         # Clean up file if exists
@@ -201,40 +452,142 @@ async def upload_file(
                 pass
         raise HTTPException(status_code=500, detail=f"خطأ في رفع الملف: {str(e)}")
     
+@app.post("/upload/batch")
+async def upload_files_batch(
+    files: List[UploadFile] = File(...),
+    namespace: str = Form("default"),
+):
+    """Upload several documents at once; they are parsed in parallel and embedded together"""
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"الحد الأقصى لعدد الملفات هو {MAX_BATCH_FILES}")
+    
+    saved_paths = []
+    try:
+        collection_name = sanitize_collection_name(f"documents_{namespace}")
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        
+        entries = []
+        for file in files:
+            file_path, file_size, file_hash = await save_temp_upload(file, namespace, timestamp)
+            saved_paths.append(file_path)
+            entries.append({
+                "file_path": str(file_path),
+                "file_name": file.filename,
+                "file_hash": file_hash,
+                "file_size": file_size
+            })
+        
+        job = BatchIngestionJob(entries, namespace=namespace, collection_name=collection_name)
+        try:
+            ingestion_queue.submit(job)
+        except IngestionQueueFull as queue_error:
+            raise HTTPException(
+                status_code=503,
+                detail=f"قائمة المعالجة ممتلئة، يرجى المحاولة لاحقاً: {queue_error}"
+            )
+        
+        return {
+            "message": f"تم رفع {len(entries)} ملف وجدولتها للمعالجة",
+            "job_id": job.job_id,
+            "status": job.status,
+            "namespace": namespace,
+            "collection_name": collection_name,
+            "files": [
+                {"file_name": e["file_name"], "file_hash": e["file_hash"], "size_bytes": e["file_size"]}
+                for e in entries
+            ],
+            "timestamp": timestamp
+        }
+    
+    except HTTPException:
+        for file_path in saved_paths:
+            file_path.unlink(missing_ok=True)
+        raise
+    except Exception as e:
+        logger.error(f"Error uploading files: {e}")
+        for file_path in saved_paths:
+            file_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=500, detail=f"خطأ في رفع الملفات: {str(e)}")
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Get status and progress of a background ingestion job"""
+    job = ingestion_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
 @app.get("/collections/{namespace}")
 async def get_collections_for_namespace(namespace: str):
     """Get all collections for a specific namespace"""
     try:
-        # Initialize memory store
-        memory_store = ChromaMemoryStore(persist_directory=CHROMA_BASE_PATH)
-        
-        # Get all collections
-        collections = await memory_store.get_collections()
+        catalog = get_catalog()
+        if not catalog:
+            raise HTTPException(status_code=503, detail="Document catalog not available")
         
-        # Filter collections for this namespace
-        namespace_collections = [
-            col for col in collections 
-            if col.startswith(f"documents_{namespace}") or col == f"documents_{namespace}"
-        ]
+        # Indexed catalog lookups instead of listing and filtering every collection
+        namespace_collections = catalog.list_collections(namespace)
+        all_collections = [c["collection_name"] for c in catalog.list_collections()]
         
         return {
             "namespace": namespace,
-            "collections": namespace_collections,
-            "total_collections": len(collections),
-            "all_collections": collections
+            "collections": [c["collection_name"] for c in namespace_collections],
+            "details": namespace_collections,
+            "total_collections": len(all_collections),
+            "all_collections": all_collections
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting collections: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/namespaces/{namespace}/documents")
+async def get_namespace_documents(namespace: str):
+    """Get the source documents ingested into a namespace"""
+    catalog = get_catalog()
+    if not catalog:
+        raise HTTPException(status_code=503, detail="Document catalog not available")
+    
+    documents = catalog.list_documents(namespace)
+    return {
+        "namespace": namespace,
+        "documents": documents,
+        "count": len(documents)
+    }
+
+@app.get("/namespaces/{namespace}/services")
+async def get_namespace_services(namespace: str):
+    """Get the service definitions extracted from a namespace's documents"""
+    service_catalog = get_service_catalog() if SERVICE_CATALOG_ENABLED else None
+    if not service_catalog:
+        raise HTTPException(status_code=503, detail="Service catalog not available")
+    
+    services = service_catalog.list_services(namespace)
+    return {
+        "namespace": namespace,
+        "services": services,
+        "count": len(services)
+    }
+
+@app.post("/catalog/sync")
+async def sync_catalog():
+    """Register vector store collections that are missing from the catalog"""
+    try:
+        await (await get_kernel_config_async()).sync_catalog()
+        return {"message": "Catalog synchronized", "namespaces": get_catalog().list_namespaces()}
+    except Exception as e:
+        logger.error(f"Error synchronizing catalog: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # 5. إضافة endpoint لفحص محتوى Collection معينة
 @app.get("/collections/{namespace}/{collection_name}/documents")
 async def get_collection_documents(namespace: str, collection_name: str, limit: int = 10):
     """Get documents from a specific collection"""
     try:
-        # Initialize services
-        sk_config = SemanticKernelConfig()
+        # Use the shared Semantic Kernel services
+        sk_config = await get_kernel_config_async()
         
         if not sk_config.semantic_memory:
             raise HTTPException(status_code=500, detail="Semantic memory not available")
@@ -268,14 +621,22 @@ async def get_collection_documents(namespace: str, collection_name: str, limit:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/requests/{request_id}")
-async def get_request(request_id: str):
+async def get_request(request_id: str, db: AsyncSession = Depends(get_db)):
     """Get specific request by ID"""
     try:
-        db = SessionLocal()
-        request = get_request_by_id(db, request_id)
-        db.close()
+        request = await get_request_by_id(db, request_id)
         
         if not request:
+            # Accepted in write-behind mode but not yet inserted
+            pending = request_writer.get_pending(request_id) if request_writer else None
+            if pending:
+                return {
+                    "id": None,
+                    **pending,
+                    "created_at": pending["created_at"].isoformat(),
+                    "updated_at": pending["updated_at"].isoformat(),
+                    "notes": None
+                }
             raise HTTPException(status_code=404, detail="Request not found")
         
         return {
@@ -297,15 +658,21 @@ async def get_request(request_id: str):
         logger.error(f"Error getting request: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/validate")
+async def validate_form(form: FormValidationRequest):
+    """Validate a whole form of fields in one call and return every error together"""
+    if not form.fields:
+        raise HTTPException(status_code=400, detail="No fields provided")
+    return validator_registry.validate_form(form.fields)
+
 @app.put("/requests/{request_id}/status")
-async def update_request_status_endpoint(request_id: str, status_update: RequestStatusUpdate):
+async def update_request_status_endpoint(request_id: str, status_update: RequestStatusUpdate,
+                                         db: AsyncSession = Depends(get_db)):
     """Update request status"""
     try:
-        db = SessionLocal()
-        updated_request = update_request_status(
+        updated_request = await update_request_status(
             db, request_id, status_update.status, status_update.notes
         )
-        db.close()
         
         if not updated_request:
             raise HTTPException(status_code=404, detail="Request not found")
@@ -319,76 +686,63 @@ async def update_request_status_endpoint(request_id: str, status_update: Request
         
     except HTTPException:
         raise
+    except StatusUpdateConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"Error updating request status: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/stats")
-async def get_stats():
-    """Get service request statistics with enhanced error handling"""
-    db = None
+@app.put("/requests/status:bulk")
+async def bulk_update_request_status_endpoint(bulk_update: BulkStatusUpdate, db: AsyncSession = Depends(get_db)):
+    """Change the status of many requests at once: either `request_ids` (plain ids, or
+    objects with optimistic expected_status/expected_updated_at checks) or a `filter`"""
+    if (bulk_update.request_ids is None) == (bulk_update.filter is None):
+        raise HTTPException(status_code=400, detail="Provide either request_ids or filter")
+    
+    items = None
+    filters = None
+    if bulk_update.request_ids is not None:
+        if len(bulk_update.request_ids) > BULK_STATUS_MAX_REQUESTS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"At most {BULK_STATUS_MAX_REQUESTS} requests per bulk update"
+            )
+        items = [
+            {"request_id": item} if isinstance(item, str) else item.model_dump()
+            for item in bulk_update.request_ids
+        ]
+    else:
+        filters = bulk_update.filter.model_dump(exclude_none=True)
+        if not filters:
+            raise HTTPException(status_code=400, detail="The filter must have at least one criterion")
+    
     try:
-        db = SessionLocal()
-        
-        # Basic counts with error handling
-        total_requests = db.query(ServiceRequestModel).count()
-        pending_requests = db.query(ServiceRequestModel).filter(
-            ServiceRequestModel.status == RequestStatus.PENDING
-        ).count()
-        completed_requests = db.query(ServiceRequestModel).filter(
-            ServiceRequestModel.status == RequestStatus.COMPLETED
-        ).count()
-        in_progress_requests = db.query(ServiceRequestModel).filter(
-            ServiceRequestModel.status == RequestStatus.IN_PROGRESS
-        ).count()
-        rejected_requests = db.query(ServiceRequestModel).filter(
-            ServiceRequestModel.status == RequestStatus.REJECTED
-        ).count()
-        cancelled_requests = db.query(ServiceRequestModel).filter(
-            ServiceRequestModel.status == RequestStatus.CANCELLED
-        ).count()
-        
-        # Service distribution with proper SQLAlchemy syntax
-        try:
-            from sqlalchemy import func
-            service_stats = db.query(
-                ServiceRequestModel.service_name,
-                func.count(ServiceRequestModel.id).label('count')
-            ).group_by(ServiceRequestModel.service_name).all()
-            
-            service_distribution = [
-                {
-                    "service_name": stat.service_name or "غير محدد", 
-                    "count": stat.count
-                } 
-                for stat in service_stats
-            ]
-        except Exception as service_error:
-            logger.error(f"Error getting service distribution: {service_error}")
-            service_distribution = []
-        
-        # Recent requests (last 7 days) for trend analysis
-        try:
-            from datetime import datetime, timedelta
-            week_ago = datetime.now() - timedelta(days=7)
-            recent_requests = db.query(ServiceRequestModel).filter(
-                ServiceRequestModel.created_at >= week_ago
-            ).count()
-        except Exception as recent_error:
-            logger.error(f"Error getting recent requests: {recent_error}")
-            recent_requests = 0
+        result = await bulk_update_request_status(
+            db, bulk_update.status, bulk_update.notes, items=items, filters=filters,
+            expected_status=bulk_update.expected_status, max_requests=BULK_STATUS_MAX_REQUESTS
+        )
+        if result["updated"]:
+            stats_cache["data"] = None
+        logger.info(f"Bulk status update to {result['status']}: {result['outcomes']}")
+        return result
         
-        return {
-            "total_requests": total_requests,
-            "pending_requests": pending_requests,
-            "completed_requests": completed_requests,
-            "in_progress_requests": in_progress_requests,
-            "rejected_requests": rejected_requests,
-            "cancelled_requests": cancelled_requests,
-            "recent_requests_week": recent_requests,
-            "service_distribution": service_distribution,
-            "status": "success"
-        }
+    except Exception as e:
+        logger.error(f"Error in bulk status update: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Last /stats response and when it expires
+stats_cache: Dict[str, Any] = {"data": None, "expires_at": 0.0}
+
+@app.get("/stats")
+async def get_stats(db: AsyncSession = Depends(get_db)):
+    """Get service request statistics from the incrementally maintained counters"""
+    if stats_cache["data"] is not None and time.monotonic() < stats_cache["expires_at"]:
+        return stats_cache["data"]
+    try:
+        stats = {**await get_request_stats(db), "status": "success"}
+        stats_cache["data"] = stats
+        stats_cache["expires_at"] = time.monotonic() + STATS_CACHE_TTL_SECONDS
+        return stats
         
     except Exception as e:
         logger.error(f"Error getting stats: {e}", exc_info=True)
@@ -400,20 +754,55 @@ async def get_stats():
                 "type": type(e).__name__
             }
         )
-    finally:
-        if db:
-            db.close()
 
+@app.post("/stats/rebuild")
+async def rebuild_stats(db: AsyncSession = Depends(get_db)):
+    """Recompute the /stats counters from service_requests (after out-of-band data changes)"""
+    try:
+        await rebuild_request_counters(db, force=True)
+        stats_cache["data"] = None
+        return {"message": "Request counters rebuilt"}
+    except Exception as e:
+        logger.error(f"Error rebuilding request counters: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/embedding-cache")
+async def get_embedding_cache_stats():
+    """Get embedding cache size and hit/miss counters"""
+    embedding_cache = (await get_kernel_config_async()).embedding_cache
+    if not embedding_cache:
+        return {"enabled": False}
+    return {"enabled": True, **embedding_cache.stats()}
 
+@app.get("/service-cache")
+async def get_service_cache_stats():
+    """Get identify_service semantic cache entries per namespace and hit/miss counters"""
+    service_cache = (await get_kernel_config_async()).service_cache
+    if not service_cache:
+        return {"enabled": False}
+    return {"enabled": True, **service_cache.stats()}
 
+@app.get("/metrics/dispatch")
+async def get_dispatch_metrics():
+    """Get how chat-turn time splits between kernel dispatch and the functions it runs"""
+    return {"fast_path": PLUGIN_FAST_PATH, **dispatch_stats.as_dict()}
 
+@app.get("/metrics/write-behind")
+async def get_write_behind_stats():
+    """Get write-behind request queue depth and flush counters"""
+    if not request_writer:
+        return {"enabled": False}
+    return request_writer.stats()
 
 @app.get("/namespaces")
 async def get_namespaces():
     """Get all available namespaces"""
     try:
-        namespaces = [d for d in os.listdir(CHROMA_BASE_PATH) 
-                     if os.path.isdir(os.path.join(CHROMA_BASE_PATH, d))]
+        if catalog_sync_task and not catalog_sync_task.done():
+            # Existing collections are still being registered after startup with an empty catalog
+            await asyncio.shield(catalog_sync_task)
+        catalog = get_catalog()
+        namespaces = catalog.list_namespaces() if catalog else []
         return {"namespaces": namespaces}
     except Exception as e:
         logger.error(f"Error getting namespaces: {e}")
@@ -427,39 +816,49 @@ async def get_active_sessions():
     """Get all active chat sessions with detailed information"""
     session_details = {}
     
-    for session_id, session_data in chat_sessions.items():
-        agent = session_data['agent']
+    total_bytes = 0
+    async for session_id, record, size_bytes in iter_session_records():
+        agent_state = record['agent']
+        total_bytes += size_bytes
         session_details[session_id] = {
-            "created_at": session_data['created_at'].isoformat(),
-            "last_activity": session_data['last_activity'].isoformat(),
-            "message_count": session_data['message_count'],
-            "state": agent.state,
-            "namespace": agent.namespace,
-            "service_info": agent.service_info,
-            "collected_fields": len(agent.collected_data),
-            "total_required_fields": len(agent.required_fields),
-            "chat_history_length": len(agent.chat_history.messages)
+            "created_at": record['created_at'],
+            "last_activity": record['last_activity'],
+            "message_count": record['message_count'],
+            "state": agent_state['state'],
+            "namespace": agent_state['namespace'],
+            "service_info": agent_state['service_info'],
+            "collected_fields": len(agent_state['collected_data']),
+            "total_required_fields": len(agent_state['required_fields']),
+            "chat_history_length": len(agent_state['history']),
+            "size_bytes": size_bytes
         }
     
     return {
-        "active_sessions": len(chat_sessions),
+        "active_sessions": len(session_details),
+        "store": SESSION_STORE_BACKEND if session_store else "memory",
+        # Approximate memory for in-memory sessions, serialised size for an external store
+        "total_size_bytes": total_bytes,
+        "limits": chat_sessions.stats() if session_store is None else {"ttl_seconds": SESSION_TTL_SECONDS},
         "sessions": session_details
     }
 
 @app.get("/sessions/{session_id}/history")
 async def get_session_history(session_id: str):
     """Get chat history for a specific session"""
-    if session_id not in chat_sessions:
+    if session_store is None:
+        session = chat_sessions.peek(session_id)
+        record = session_record(session, history_limit=None) if session else None
+    else:
+        record = await session_store.get(session_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    agent = chat_sessions[session_id]['agent']
     history = []
-    
-    for msg in agent.chat_history.messages:
+    for role, content in record['agent']['history']:
         history.append({
-            "role": "user" if msg.role == AuthorRole.USER else "assistant",
-            "content": msg.content,
-            "timestamp": getattr(msg, 'timestamp', None)
+            "role": "user" if role == "u" else "assistant",
+            "content": content,
+            "timestamp": None
         })
     
     return {
@@ -467,9 +866,9 @@ async def get_session_history(session_id: str):
         "history": history,
         "message_count": len(history),
         "session_info": {
-            "created_at": chat_sessions[session_id]['created_at'].isoformat(),
-            "last_activity": chat_sessions[session_id]['last_activity'].isoformat(),
-            "total_messages": chat_sessions[session_id]['message_count']
+            "created_at": record['created_at'],
+            "last_activity": record['last_activity'],
+            "total_messages": record['message_count']
         }
     }
     
@@ -0,0 +1,52 @@
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import select
+
+from models import Base, ServiceRequestModel, ServiceNameGramModel, SchemaMigrationModel
+from utils import service_name_gram_rows, insert_ignore
+
+logger = logging.getLogger(__name__)
+
+
+def _create_request_indexes(conn):
+    """Filter/keyset indexes of service_requests: (created_at, id), (status, created_at, id),
+    (namespace, created_at, id), (service_name, created_at, id) and session_id"""
+    for index in ServiceRequestModel.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+def _build_service_name_grams(conn):
+    """Trigram index of the service names already in service_requests"""
+    names = conn.execute(select(ServiceRequestModel.service_name).distinct()).scalars().all()
+    rows = [row for name in names if name for row in service_name_gram_rows(name)]
+    if rows:
+        conn.execute(insert_ignore(conn.dialect.name, ServiceNameGramModel), rows)
+
+
+# Ordered schema changes for databases created before the current models.
+# Each runs once, in its own transaction, and is recorded in schema_migrations.
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "service_requests filter indexes", _create_request_indexes),
+    (2, "service name trigram index", _build_service_name_grams),
+]
+
+
+async def run_migrations(engine) -> List[int]:
+    """Apply the migrations not yet recorded in schema_migrations; returns the applied versions"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[SchemaMigrationModel.__table__])
+        applied = set((await conn.execute(select(SchemaMigrationModel.version))).scalars())
+
+    newly_applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        async with engine.begin() as conn:
+            await conn.run_sync(migrate)
+            await conn.execute(SchemaMigrationModel.__table__.insert().values(
+                version=version, description=description, applied_at=datetime.now()
+            ))
+        logger.info(f"Applied database migration {version}: {description}")
+        newly_applied.append(version)
+    return newly_applied
@@ -1,11 +1,14 @@
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
-from sqlalchemy import create_engine, Column, String, JSON, DateTime, Integer, Text
+from typing import List, Dict, Any, Optional, Union
+from typing import AsyncGenerator
+from sqlalchemy import Column, String, JSON, Date, DateTime, Integer, Text, Index
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 
-from config import DATABASE_URL, RequestStatus
+from config import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_ECHO, RequestStatus
+)
 
 Base = declarative_base()
 
@@ -22,6 +25,45 @@ class ServiceRequestModel(Base):
     session_id = Column(String(64))
     namespace = Column(String(64), default="default")
     notes = Column(Text, nullable=True)
+    
+    __table_args__ = (
+        # Keyset pagination order of GET /requests: (created_at, id), optionally after an equality filter
+        Index("ix_service_requests_created_id", "created_at", "id"),
+        Index("ix_service_requests_status_created", "status", "created_at", "id"),
+        Index("ix_service_requests_namespace_created", "namespace", "created_at", "id"),
+        Index("ix_service_requests_service_created", "service_name", "created_at", "id"),
+        Index("ix_service_requests_session", "session_id"),
+    )
+
+class RequestStatusCountModel(Base):
+    """Number of requests per (service, status), kept up to date on create and status change"""
+    __tablename__ = "request_status_counts"
+    
+    service_name = Column(String(128), primary_key=True)
+    status = Column(String(32), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class RequestDailyCountModel(Base):
+    """Number of requests created per day"""
+    __tablename__ = "request_daily_counts"
+    
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class ServiceNameGramModel(Base):
+    """Trigram index of the distinct (normalised) service names, for substring search"""
+    __tablename__ = "service_name_grams"
+    
+    gram = Column(String(16), primary_key=True)
+    service_name = Column(String(128), primary_key=True)
+
+class SchemaMigrationModel(Base):
+    """Versions of the migrations in migrations.py already applied to this database"""
+    __tablename__ = "schema_migrations"
+    
+    version = Column(Integer, primary_key=True)
+    description = Column(String(255))
+    applied_at = Column(DateTime, default=datetime.now)
 
 # Pydantic models
 class ChatMessage(BaseModel):
@@ -38,6 +80,9 @@ class ChatResponse(BaseModel):
     completed: bool = False
     validation_error: Optional[str] = None
 
+class FormValidationRequest(BaseModel):
+    fields: Dict[str, Any]
+
 class ServiceRequestData(BaseModel):
     service_name: str
     user_data: Dict[str, Any]
@@ -47,11 +92,35 @@ class RequestStatusUpdate(BaseModel):
     status: RequestStatus
     notes: Optional[str] = None
 
+class BulkStatusItem(BaseModel):
+    request_id: str
+    # Optimistic checks: the change is skipped if the request moved on since it was read
+    expected_status: Optional[RequestStatus] = None
+    expected_updated_at: Optional[datetime] = None
+
+class RequestFilter(BaseModel):
+    status: Optional[RequestStatus] = None
+    service_name: Optional[str] = None
+    namespace: Optional[str] = None
+    session_id: Optional[str] = None
+    created_before: Optional[datetime] = None
+
+class BulkStatusUpdate(BaseModel):
+    """Target status for either explicit requests or every request matching a filter"""
+    status: RequestStatus
+    notes: Optional[str] = None
+    request_ids: Optional[List[Union[str, BulkStatusItem]]] = None
+    filter: Optional[RequestFilter] = None
+    # Applies to every request (in filter mode, same as filter.status)
+    expected_status: Optional[RequestStatus] = None
+
 class RequestQuery(BaseModel):
-    page: int = 1
+    cursor: Optional[str] = None
     limit: int = 10
     status: Optional[RequestStatus] = None
     service_name: Optional[str] = None
+    namespace: Optional[str] = None
+    session_id: Optional[str] = None
 
 class UploadResponse(BaseModel):
     message: str
@@ -60,7 +129,37 @@ class UploadResponse(BaseModel):
     collection: str
     processing_result: Dict[str, Any]
 
-# Create DB engine and tables
-engine = create_engine(DATABASE_URL)
-Base.metadata.create_all(engine)
-SessionLocal = sessionmaker(bind=engine)
\ No newline at end of file
+def create_engine_from_config():
+    """Async engine with an explicit connection pool (SQLite/aiosqlite keeps its default pool)"""
+    options = {"echo": DB_ECHO}
+    if not DATABASE_URL.startswith("sqlite"):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True
+        )
+    return create_async_engine(DATABASE_URL, **options)
+
+# Create DB engine (connections are opened lazily); tables are checked in init_db()
+engine = create_engine_from_config()
+AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    """FastAPI dependency: one session per request, closed when the request finishes"""
+    async with AsyncSessionLocal() as session:
+        yield session
+
+async def init_db():
+    """Create missing tables and apply pending migrations. Called from the application startup hook."""
+    # Imported here: migrations.py builds on the models and helpers defined after this module
+    from migrations import run_migrations
+    
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await run_migrations(engine)
+
+async def dispose_db():
+    """Close every pooled connection. Called from the application shutdown hook."""
+    await engine.dispose()
\ No newline at end of file
@@ -0,0 +1,209 @@
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional, AsyncIterator
+
+from config import EXPORT_BATCH_SIZE
+from models import AsyncSessionLocal, ServiceRequestModel
+from utils import stream_requests
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = [
+    "id", "request_id", "service_name", "status", "created_at", "updated_at",
+    "session_id", "namespace", "notes"
+]
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class ExportDependencyError(Exception):
+    """Raised when the library needed for an export format is not installed"""
+
+
+def flatten_user_data(data: Any, prefix: str = "user_data") -> Dict[str, Any]:
+    """{"a": {"b": 1}} -> {"user_data.a.b": 1}; lists are kept as JSON text"""
+    if not isinstance(data, dict):
+        return {prefix: data} if data is not None else {}
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}.{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_user_data(value, name))
+        elif isinstance(value, list):
+            flat[name] = json.dumps(value, ensure_ascii=False)
+        else:
+            flat[name] = value
+    return flat
+
+
+def _record(row, flatten: bool) -> Dict[str, Any]:
+    record = {column: row[column] for column in EXPORT_COLUMNS}
+    for column in ("created_at", "updated_at"):
+        if record[column] is not None:
+            record[column] = record[column].isoformat()
+    if flatten:
+        record.update(flatten_user_data(row["user_data"]))
+    else:
+        record["user_data"] = row["user_data"]
+    return record
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+class RequestExport:
+    """One streamed export of the requests matching `filters`.
+
+    Rows are read through a server-side cursor EXPORT_BATCH_SIZE at a time and
+    each batch is encoded and sent before the next is read. CSV and Parquet
+    need their columns up front, so flattening user_data for them costs one
+    extra streamed pass to collect the keys, unless `user_data_keys` names them.
+    """
+
+    def __init__(self, fmt: str, filters: Dict[str, Any], flatten: bool = False,
+                 user_data_keys: Optional[List[str]] = None, batch_size: int = EXPORT_BATCH_SIZE):
+        self.format = fmt
+        self.filters = filters
+        self.flatten = flatten
+        self.user_data_keys = user_data_keys
+        self.batch_size = batch_size
+        self.rows_exported = 0
+        if fmt == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ExportDependencyError("Parquet export requires the pyarrow package")
+
+    @property
+    def media_type(self) -> str:
+        return EXPORT_FORMATS[self.format][0]
+
+    @property
+    def filename(self) -> str:
+        return f"requests_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{EXPORT_FORMATS[self.format][1]}"
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        # Own session: the generator outlives the request handler that created it
+        async with AsyncSessionLocal() as db:
+            columns = [getattr(ServiceRequestModel, column) for column in EXPORT_COLUMNS + ["user_data"]]
+            batches = stream_requests(db, columns, self.batch_size, **self.filters)
+            if self.format == "ndjson":
+                encoder = self._ndjson(batches)
+            else:
+                user_data_columns = await self._user_data_columns(db) if self.flatten else ["user_data"]
+                encoder = (self._csv if self.format == "csv" else self._parquet)(batches, user_data_columns)
+            try:
+                async for chunk in encoder:
+                    yield chunk
+            except Exception as e:
+                # Headers are already sent; the client sees a truncated file
+                logger.error(f"Export failed after {self.rows_exported} requests: {e}")
+                raise
+        logger.info(f"Exported {self.rows_exported} requests as {self.format}")
+
+    async def _user_data_columns(self, db) -> List[str]:
+        if self.user_data_keys:
+            return [f"user_data.{key}" for key in self.user_data_keys]
+        keys: Dict[str, None] = {}
+        async for rows in stream_requests(db, [ServiceRequestModel.user_data], self.batch_size, **self.filters):
+            for row in rows:
+                keys.update(dict.fromkeys(flatten_user_data(row["user_data"])))
+        return list(keys)
+
+    async def _ndjson(self, batches) -> AsyncIterator[bytes]:
+        async for rows in batches:
+            self.rows_exported += len(rows)
+            yield "".join(
+                json.dumps(_record(row, self.flatten), ensure_ascii=False, default=str) + "\n" for row in rows
+            ).encode("utf-8")
+
+    async def _csv(self, batches, user_data_columns: List[str]) -> AsyncIterator[bytes]:
+        header = EXPORT_COLUMNS + user_data_columns
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # BOM so spreadsheet applications read the Arabic text as UTF-8
+        buffer.write("\ufeff")
+        writer.writerow(header)
+        async for rows in batches:
+            self.rows_exported += len(rows)
+            for row in rows:
+                record = _record(row, self.flatten)
+                writer.writerow([_text(record.get(column)) for column in header])
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+    async def _parquet(self, batches, user_data_columns: List[str]) -> AsyncIterator[bytes]:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema(
+            [("id", pa.int64())]
+            + [(column, pa.string()) for column in EXPORT_COLUMNS[1:4]]
+            + [("created_at", pa.timestamp("us")), ("updated_at", pa.timestamp("us"))]
+            + [(column, pa.string()) for column in EXPORT_COLUMNS[6:] + user_data_columns]
+        )
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema)
+        try:
+            # One row group per batch, handed to the client as soon as it is written
+            async for rows in batches:
+                self.rows_exported += len(rows)
+                data = {column: [] for column in schema.names}
+                for row in rows:
+                    flat = flatten_user_data(row["user_data"]) if self.flatten else {"user_data": row["user_data"]}
+                    for column in EXPORT_COLUMNS:
+                        data[column].append(row[column])
+                    for column in user_data_columns:
+                        data[column].append(_text(flat.get(column)))
+                writer.write_table(pa.Table.from_pydict(data, schema=schema))
+                chunk = sink.take()
+                if chunk:
+                    yield chunk
+        finally:
+            writer.close()
+        yield sink.take()
+
+
+class _ChunkSink:
+    """Write-only file object that hands back what was written since the last take()"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
@@ -0,0 +1,319 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import insert, select
+
+from config import (
+    WRITE_BEHIND_ENABLED, WRITE_BEHIND_QUEUE_SIZE, WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_FLUSH_SECONDS, WRITE_BEHIND_MAX_RETRIES, WRITE_BEHIND_SPOOL_PATH
+)
+from models import AsyncSessionLocal, ServiceRequestModel
+from utils import count_new_requests
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueueFull(Exception):
+    """Raised when the write-behind queue cannot accept more requests"""
+
+
+class RequestWriteBehind:
+    """Buffers new service requests and inserts them in multi-row batches.
+
+    A batch is flushed when it reaches `batch_size` rows or `flush_seconds`
+    after its first row. Rows that cannot be written (database down, or still
+    queued at shutdown after a failed flush) are appended to this process's
+    JSONL spool file (`<spool>.<pid>.jsonl`) and replayed once the database
+    accepts writes again, or by the next process to start, so accepted requests
+    are not lost. A spool file is renamed before it is read, so two workers
+    never replay the same rows. Replayed rows that the database still rejects
+    one by one go to `<spool>.quarantine.jsonl` for manual inspection.
+    """
+
+    def __init__(self, max_queued: int, batch_size: int, flush_seconds: float, spool_path: str):
+        self.max_queued = max_queued
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.spool_path = spool_path
+        self._spool_stem = spool_path[:-len(".jsonl")] if spool_path.endswith(".jsonl") else spool_path
+        self.quarantine_path = f"{self._spool_stem}.quarantine.jsonl"
+        self.rows_flushed = 0
+        self.batches_flushed = 0
+        self.flush_failures = 0
+        self.rows_spooled = 0
+        self.rows_replayed = 0
+        self.rows_quarantined = 0
+        # Rows this process spooled since its spool file was last replayed
+        self._spooled = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._flushing = False
+        # Batch being assembled, or whose last flush failed (retried before new rows)
+        self._batch: List[Dict[str, Any]] = []
+        # request_id -> row, for rows accepted but not yet committed (spooled rows included)
+        self._pending: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Replay spooled rows and start the flusher; must be called from the running event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._stopping = False
+        await self._replay_spool(startup=True)
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Started write-behind request writer (batch {self.batch_size}, "
+            f"every {self.flush_seconds}s, queue size {self.max_queued})"
+        )
+
+    async def stop(self):
+        """Stop the flusher and write every queued row (spooling them if the database fails)"""
+        if self._task is None:
+            return
+        self._stopping = True
+        if not self._flushing:
+            self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+        rows = self._batch + self._drain(self._queue.qsize())
+        self._batch = []
+        if rows and not await self._flush(rows):
+            self._spool(rows)
+
+    def submit(self, row: Dict[str, Any]):
+        """Queue one service_requests row (with its request_id already assigned)"""
+        if not self.running:
+            raise RuntimeError("Write-behind request writer is not started")
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            raise WriteBehindQueueFull(f"write-behind queue is full ({self.max_queued} requests)")
+        self._pending[row["request_id"]] = row
+
+    def get_pending(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """A request accepted but not yet written to the database, if any"""
+        return self._pending.get(request_id)
+
+    def _drain(self, limit: int) -> List[Dict[str, Any]]:
+        rows = []
+        while len(rows) < limit and not self._queue.empty():
+            rows.append(self._queue.get_nowait())
+        return rows
+
+    async def _run(self):
+        failures = 0
+        while not self._stopping:
+            if not self._batch:
+                self._batch = [await self._queue.get()]
+            # Wait for a full batch, but no longer than flush_seconds after its first row
+            deadline = time.monotonic() + self.flush_seconds
+            while len(self._batch) < self.batch_size:
+                self._batch.extend(self._drain(self.batch_size - len(self._batch)))
+                remaining = deadline - time.monotonic()
+                if len(self._batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Not cancelled by stop() while a batch is in flight
+            self._flushing = True
+            try:
+                if await self._flush(self._batch):
+                    self._batch = []
+                    failures = 0
+                    # The database accepts writes again: retry what this process spooled
+                    if self._spooled:
+                        await self._replay_spool()
+                    continue
+                failures += 1
+                if failures >= WRITE_BEHIND_MAX_RETRIES:
+                    # The database keeps failing; keep the rows on disk instead of in memory
+                    self._spool(self._batch)
+                    self._batch = []
+                    failures = 0
+            finally:
+                self._flushing = False
+            await asyncio.sleep(min(self.flush_seconds * 4, 5.0))
+
+    async def _flush(self, rows: List[Dict[str, Any]]) -> bool:
+        """Insert rows with one multi-row INSERT; returns False (rows untouched) on failure"""
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(ServiceRequestModel), rows)
+                await count_new_requests(db, rows)
+                await db.commit()
+        except Exception as e:
+            self.flush_failures += 1
+            logger.error(f"Write-behind flush of {len(rows)} requests failed: {e}")
+            return False
+        for row in rows:
+            self._pending.pop(row["request_id"], None)
+        self.rows_flushed += len(rows)
+        self.batches_flushed += 1
+        logger.info(f"Write-behind flushed {len(rows)} requests")
+        return True
+
+    @property
+    def own_spool_path(self) -> str:
+        return f"{self._spool_stem}.{os.getpid()}.jsonl"
+
+    def _spool(self, rows: List[Dict[str, Any]]):
+        """Append rows to this process's spool file; they stay visible through get_pending"""
+        with open(self.own_spool_path, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
+        self._spooled += len(rows)
+        self.rows_spooled += len(rows)
+        logger.warning(f"Spooled {len(rows)} unwritten requests to {self.own_spool_path}")
+
+    def _quarantine(self, rows: List[Dict[str, Any]]):
+        with open(self.quarantine_path, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
+        for row in rows:
+            self._pending.pop(row["request_id"], None)
+        self.rows_quarantined += len(rows)
+        logger.error(f"Quarantined {len(rows)} spooled requests the database rejects to {self.quarantine_path}")
+
+    def _claimable_spools(self, startup: bool) -> List[str]:
+        """Spool files to replay: this process's own, plus at startup those left by stopped processes"""
+        if not startup:
+            return [self.own_spool_path] if os.path.exists(self.own_spool_path) else []
+        directory = os.path.dirname(self.spool_path) or "."
+        pattern = re.compile(
+            rf"^{re.escape(os.path.basename(self._spool_stem))}(?:\.(\d+)(?:\.replaying)?)?\.jsonl$"
+        )
+        paths = []
+        for name in sorted(os.listdir(directory)):
+            match = pattern.match(name)
+            if not match:
+                continue
+            pid = int(match.group(1)) if match.group(1) else None
+            # A live worker replays its own spool; the spool directory must not be shared across hosts
+            if pid is None or pid == os.getpid() or not _process_alive(pid):
+                paths.append(os.path.join(directory, name))
+        return paths
+
+    async def _replay_spool(self, startup: bool = False):
+        self._spooled = 0
+        for path in self._claimable_spools(startup):
+            claimed = f"{self._spool_stem}.{os.getpid()}.replaying.jsonl"
+            try:
+                if path != claimed:
+                    os.replace(path, claimed)
+            except FileNotFoundError:
+                # Another worker claimed it first
+                continue
+            await self._replay_file(claimed)
+
+    async def _replay_file(self, path: str):
+        rows, malformed = [], []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    for column in ("created_at", "updated_at"):
+                        if isinstance(row.get(column), str):
+                            row[column] = datetime.fromisoformat(row[column])
+                    rows.append(row)
+                except (ValueError, TypeError):
+                    malformed.append(line)
+        if malformed:
+            with open(self.quarantine_path, "a", encoding="utf-8") as f:
+                f.writelines(malformed)
+            self.rows_quarantined += len(malformed)
+            logger.error(f"Quarantined {len(malformed)} unreadable lines from {path}")
+        for row in rows:
+            self._pending.setdefault(row["request_id"], row)
+
+        replayed = 0
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            existing = await self._existing_request_ids(batch)
+            if existing is None:
+                self._spool(rows[start:])
+                break
+            # Rows a crash left in the spool after they were committed
+            for row in batch:
+                if row["request_id"] in existing:
+                    self._pending.pop(row["request_id"], None)
+            batch = [row for row in batch if row["request_id"] not in existing]
+            if not batch or await self._flush(batch):
+                replayed += len(batch)
+                continue
+            # Find the rows the database rejects, one at a time
+            rejected = []
+            for row in batch:
+                if await self._flush([row]):
+                    replayed += 1
+                else:
+                    rejected.append(row)
+            if len(rejected) == len(batch):
+                # Nothing in the batch could be written: the database is down, not the rows
+                self._spool(rows[start:])
+                break
+            self._quarantine(rejected)
+        os.remove(path)
+        self.rows_replayed += replayed
+        if replayed:
+            logger.info(f"Replayed {replayed} spooled requests from {path}")
+
+    async def _existing_request_ids(self, rows: List[Dict[str, Any]]) -> Optional[set]:
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(ServiceRequestModel.request_id)
+                    .where(ServiceRequestModel.request_id.in_([row["request_id"] for row in rows]))
+                )
+                return set(result.scalars().all())
+        except Exception as e:
+            logger.error(f"Could not check spooled requests against the database: {e}")
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "pending": len(self._pending),
+            "rows_flushed": self.rows_flushed,
+            "batches_flushed": self.batches_flushed,
+            "flush_failures": self.flush_failures,
+            "rows_spooled": self.rows_spooled,
+            "rows_replayed": self.rows_replayed,
+            "rows_quarantined": self.rows_quarantined,
+            "batch_size": self.batch_size,
+            "flush_seconds": self.flush_seconds
+        }
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Process-wide writer, started and stopped by the FastAPI lifecycle hooks in main.py
+request_writer = RequestWriteBehind(
+    WRITE_BEHIND_QUEUE_SIZE, WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_SECONDS, WRITE_BEHIND_SPOOL_PATH
+) if WRITE_BEHIND_ENABLED else None
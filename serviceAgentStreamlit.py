@@ -2,6 +2,7 @@ import streamlit as st
 import requests
 import uuid
 import json
+import time
 import pandas as pd
 from datetime import datetime, timedelta
 import plotly.express as px
@@ -28,6 +29,20 @@ if "namespace" not in st.session_state:
 if "page" not in st.session_state:
     st.session_state.page = "chat"
 
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_namespaces():
+    # Failures raise, so only successful responses are cached
+    response = requests.get(f"{API_BASE_URL}/namespaces", timeout=2)
+    response.raise_for_status()
+    return response.json().get("namespaces", [])
+
+def fetch_namespaces():
+    """Namespaces from the API catalog, cached across reruns; None if the API is unreachable"""
+    try:
+        return _cached_namespaces()
+    except Exception:
+        return None
+
 # Sidebar Navigation
 with st.sidebar:
     st.title("🤖 AI Service Agent")
@@ -52,21 +67,19 @@ with st.sidebar:
     
     # API Status
     st.subheader("🔗 حالة الاتصال")
-    try:
-        response = requests.get(f"{API_BASE_URL}/namespaces", timeout=2)
-        if response.status_code == 200:
-            st.success("✅ متصل")
-        else:
-            st.error("❌ خطأ في الاتصال")
-    except:
+    if fetch_namespaces() is not None:
+        st.success("✅ متصل")
+    else:
         st.error("❌ غير متصل")
         st.warning("تأكد من تشغيل الخادم على المنفذ 8000")
 
 # Helper functions
-def get_requests_data(page=1, limit=10, status=None, service_name=None):
-    """Get requests data from API"""
+def get_requests_data(cursor=None, limit=10, status=None, service_name=None):
+    """Get one cursor page of requests from API"""
     try:
-        params = {"page": page, "limit": limit}
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
         if status:
             params["status"] = status
         if service_name:
@@ -107,6 +120,26 @@ def update_request_status(request_id, status, notes=None):
         st.error(f"خطأ في التحديث: {str(e)}")
         return False
 
+def bulk_update_requests_status(status, notes=None, request_ids=None, request_filter=None):
+    """Update the status of several requests in one call; returns the per-request outcomes"""
+    try:
+        data = {"status": status}
+        if notes:
+            data["notes"] = notes
+        if request_ids is not None:
+            data["request_ids"] = request_ids
+        else:
+            data["filter"] = request_filter
+            
+        response = requests.put(f"{API_BASE_URL}/requests/status:bulk", json=data, timeout=60)
+        if response.status_code == 200:
+            return response.json()
+        st.error(f"خطأ في التحديث الجماعي: {response.json().get('detail', response.status_code)}")
+        return None
+    except Exception as e:
+        st.error(f"خطأ في التحديث: {str(e)}")
+        return None
+
 def get_stats():
     """Get statistics from API"""
     try:
@@ -119,6 +152,59 @@ def get_stats():
         st.error(f"خطأ: {str(e)}")
         return None
 
+def render_chat_stream(response, placeholder):
+    """Render a /chat/stream SSE response into a placeholder; returns the final response dict"""
+    reply_text = ""
+    result = None
+    event = None
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            continue
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data = json.loads(line[len("data:"):].strip())
+            if event == "progress":
+                if data == "identifying_service":
+                    placeholder.markdown("🔍 جاري تحديد الخدمة المناسبة...")
+            elif event == "reply":
+                reply_text = data
+                placeholder.markdown(reply_text)
+            elif event == "service_identified" and not reply_text:
+                placeholder.markdown(f"✅ **{data.get('service_name', '')}**")
+            elif event in ("response", "error"):
+                result = data
+    
+    if result is None:
+        result = {"response": "❌ انقطع الاتصال قبل اكتمال الرد", "status": "error"}
+    placeholder.markdown(result["response"])
+    return result
+
+def wait_for_job(job_id, progress_bar, max_wait_seconds=300):
+    """Poll a background ingestion job and update the progress bar until it finishes"""
+    deadline = time.time() + max_wait_seconds
+    job = None
+    while time.time() < deadline:
+        try:
+            response = requests.get(f"{API_BASE_URL}/jobs/{job_id}", timeout=5)
+            if response.status_code != 200:
+                return None
+            job = response.json()
+        except Exception:
+            return job
+        
+        progress = job["progress"]
+        total = progress["total_chunks"] or progress["chunks_parsed"]
+        done = progress["chunks_written"] + progress["chunks_skipped"]
+        fraction = min(done / total, 1.0) if total else 0.0
+        progress_bar.progress(fraction, text=f"{job['stage']}: {done}/{total}")
+        
+        if job["status"] in ("completed", "failed"):
+            progress_bar.progress(1.0, text=job["status"])
+            return job
+        time.sleep(1)
+    return job
+
 # Status color mapping
 status_colors = {
     "pending": "🟡",
@@ -145,15 +231,7 @@ if st.session_state.page == "chat":
     
     with col1:
         # Namespace selection
-        namespaces = ["default"]
-        try:
-            response = requests.get(f"{API_BASE_URL}/namespaces", timeout=5)
-            if response.status_code == 200:
-                namespaces = response.json().get("namespaces", ["default"])
-                if not namespaces:
-                    namespaces = ["default"]
-        except:
-            pass
+        namespaces = fetch_namespaces() or ["default"]
         
         selected_namespace = st.selectbox(
             "📁 اختيار مجموعة البيانات:", 
@@ -234,15 +312,16 @@ if st.session_state.page == "chat":
                         "namespace": st.session_state.namespace
                     }
                     
-                    response = requests.post(f"{API_BASE_URL}/chat", json=chat_data, timeout=30)
+                    # Stream the reply; the read timeout applies between events, not to the whole answer
+                    response = requests.post(
+                        f"{API_BASE_URL}/chat/stream", json=chat_data, stream=True, timeout=(5, 60)
+                    )
                     
                     if response.status_code == 200:
-                        result = response.json()
+                        # Display agent response as it arrives
+                        result = render_chat_stream(response, st.empty())
                         agent_response = result["response"]
                         
-                        # Display agent response
-                        st.markdown(agent_response)
-                        
                         # Prepare message data for storage
                         message_data = {
                             "role": "assistant", 
@@ -386,9 +465,16 @@ elif st.session_state.page == "requests":
     with col1:
         page_size = st.selectbox("📄 عدد العناصر:", [10, 25, 50], index=0)
     
+    # Cursors of the pages visited so far; reset when the filters or page size change
+    query_key = (status_filter, service_filter, page_size)
+    if st.session_state.get("requests_query") != query_key:
+        st.session_state.requests_query = query_key
+        st.session_state.requests_cursors = [None]
+    cursors = st.session_state.requests_cursors
+    
     # Get requests data
     requests_data = get_requests_data(
-        page=1, 
+        cursor=cursors[-1], 
         limit=page_size, 
         status=status_filter, 
         service_name=service_filter
@@ -411,11 +497,61 @@ elif st.session_state.page == "requests":
         st.dataframe(df, use_container_width=True, hide_index=True)
         
         # Pagination info
-        total_pages = requests_data.get("total_pages", 1)
-        current_page = requests_data.get("page", 1)
-        total_requests = requests_data.get("total", 0)
+        total_requests = requests_data.get("total")
+        total_label = "غير معروف" if total_requests is None else (
+            f"~{total_requests}" if requests_data.get("total_is_estimate") else str(total_requests)
+        )
+        current_page = len(cursors)
+        
+        nav_prev, nav_info, nav_next = st.columns([1, 2, 1])
+        with nav_prev:
+            if st.button("⬅️ السابق", disabled=current_page == 1):
+                cursors.pop()
+                st.rerun()
+        with nav_info:
+            st.info(f"📊 إجمالي الطلبات: {total_label} | الصفحة: {current_page}")
+        with nav_next:
+            if st.button("التالي ➡️", disabled=not requests_data.get("next_cursor")):
+                cursors.append(requests_data["next_cursor"])
+                st.rerun()
         
-        st.info(f"📊 إجمالي الطلبات: {total_requests} | الصفحة: {current_page} من {total_pages}")
+        # Bulk status change: selected requests of this page, or everything matching the filters
+        with st.expander("🗂️ تحديث جماعي للحالة"):
+            apply_to_filter = st.checkbox(
+                "جميع الطلبات المطابقة للفلاتر الحالية",
+                disabled=not (status_filter or service_filter)
+            )
+            selected_ids = []
+            if not apply_to_filter:
+                selected_ids = st.multiselect(
+                    "الطلبات:",
+                    options=[req["request_id"] for req in requests_data["requests"]],
+                    format_func=lambda request_id: request_id[:8] + "..."
+                )
+            bulk_status = st.selectbox(
+                "الحالة الجديدة:",
+                options=list(status_names),
+                format_func=lambda x: status_names.get(x, x),
+                key="bulk_status"
+            )
+            bulk_notes = st.text_input("ملاحظات (اختيارية)", key="bulk_notes")
+            
+            if st.button("💾 تطبيق", disabled=not (apply_to_filter or selected_ids)):
+                request_filter = {"status": status_filter, "service_name": service_filter} if apply_to_filter else None
+                result = bulk_update_requests_status(
+                    bulk_status, bulk_notes,
+                    request_ids=None if apply_to_filter else selected_ids,
+                    request_filter=request_filter
+                )
+                if result:
+                    outcomes = result["outcomes"]
+                    st.success(f"✅ تم تحديث {result['updated']} من {result['matched']} طلب")
+                    if outcomes.get("conflict") or outcomes.get("not_found"):
+                        st.warning(
+                            f"⚠️ تعارض: {outcomes.get('conflict', 0)} | غير موجود: {outcomes.get('not_found', 0)}"
+                        )
+                    if result.get("truncated"):
+                        st.info("ℹ️ تم الوصول للحد الأقصى، أعد التطبيق لتحديث بقية الطلبات")
         
     else:
         st.info("📝 لا توجد طلبات متاحة")
@@ -508,15 +644,7 @@ elif st.session_state.page == "settings":
     
     with col1:
         # Namespace selection for upload
-        namespaces = ["default"]
-        try:
-            response = requests.get(f"{API_BASE_URL}/namespaces", timeout=5)
-            if response.status_code == 200:
-                namespaces = response.json().get("namespaces", ["default"])
-                if not namespaces:
-                    namespaces = ["default"]
-        except:
-            pass
+        namespaces = fetch_namespaces() or ["default"]
         
         upload_namespace = st.selectbox(
             "اختر مجموعة البيانات:", 
@@ -543,10 +671,24 @@ elif st.session_state.page == "settings":
                     response = requests.post(f"{API_BASE_URL}/upload", files=files, data=data, timeout=30)
                     
                     if response.status_code == 200:
-                        st.success(f"✅ تم رفع الملف بنجاح إلى '{upload_namespace}'!")
-                        st.balloons()
+                        job_id = response.json()["job_id"]
+                        st.success(f"✅ تم رفع الملف إلى '{upload_namespace}' وجدولته للمعالجة (رقم المهمة: {job_id})")
                     else:
                         st.error(f"❌ فشل الرفع: {response.text}")
+                        job_id = None
+                
+                # Follow the background ingestion job until it finishes
+                if job_id:
+                    progress_bar = st.progress(0.0, text="جاري معالجة الملف...")
+                    job = wait_for_job(job_id, progress_bar)
+                    if job and job["status"] == "completed":
+                        _cached_namespaces.clear()
+                        st.success(f"✅ تمت معالجة الملف: {job['progress']['chunks_written']} جزء جديد")
+                        st.balloons()
+                    elif job and job["status"] == "failed":
+                        st.error(f"❌ فشلت المعالجة: {job.get('error')}")
+                    else:
+                        st.info(f"⏳ المعالجة مستمرة في الخلفية، رقم المهمة: {job_id}")
             except Exception as e:
                 st.error(f"❌ خطأ في الرفع: {str(e)}")
     
@@ -0,0 +1,396 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+
+from config import (
+    SESSION_STORE_BACKEND, SESSION_STORE_PATH, SESSION_STORE_DIR, SESSION_REDIS_URL
+)
+
+logger = logging.getLogger(__name__)
+
+# Serialised sessions at least this large are zlib-compressed
+COMPRESS_MIN_BYTES = 1024
+
+
+def encode_session(data: Dict[str, Any]) -> bytes:
+    """Compact JSON, compressed when large; the first byte tells which"""
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        return b"z" + zlib.compress(raw, 1)
+    return b"j" + raw
+
+
+def decode_session(blob: bytes) -> Dict[str, Any]:
+    if blob[:1] == b"z":
+        return json.loads(zlib.decompress(blob[1:]))
+    return json.loads(blob[1:])
+
+
+class SessionStore(ABC):
+    """Key/value store of serialised chat sessions with Redis semantics:
+    GET, SET with an expiry (EX), DEL and SCAN over the live keys.
+
+    Writes are last-writer-wins, so any worker or node can serve any session;
+    expired sessions are never returned and are purged lazily. Backends doing
+    blocking disk I/O run it through asyncio.to_thread.
+    """
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def set(self, session_id: str, data: Dict[str, Any], ttl_seconds: float):
+        ...
+
+    @abstractmethod
+    async def delete(self, session_id: str):
+        ...
+
+    @abstractmethod
+    def scan(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        ...
+
+    def purge_expired(self) -> int:
+        """Delete expired sessions now instead of on the next read; returns how many"""
+        return 0
+
+    async def close(self):
+        pass
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in one SQLite file; shared by the workers of one host (WAL mode)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)")
+        self._conn.commit()
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, session_id)
+
+    async def set(self, session_id: str, data: Dict[str, Any], ttl_seconds: float):
+        await asyncio.to_thread(self._set, session_id, data, ttl_seconds)
+
+    async def delete(self, session_id: str):
+        await asyncio.to_thread(self._delete, session_id)
+
+    async def scan(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        for session_id, blob in await asyncio.to_thread(self._live_rows):
+            yield session_id, decode_session(blob)
+
+    def _get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE session_id = ? AND expires_at > ?", (session_id, time.time())
+            ).fetchone()
+        return decode_session(row[0]) if row else None
+
+    def _set(self, session_id: str, data: Dict[str, Any], ttl_seconds: float):
+        blob = encode_session(data)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, expires_at) VALUES (?, ?, ?)",
+                (session_id, blob, time.time() + ttl_seconds)
+            )
+            self._conn.commit()
+
+    def _delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def _live_rows(self) -> List[Tuple[str, bytes]]:
+        self.purge_expired()
+        with self._lock:
+            return self._conn.execute("SELECT session_id, data FROM sessions").fetchall()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+            self._conn.commit()
+        return deleted
+
+    async def close(self):
+        await asyncio.to_thread(self._close)
+
+    def _close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class FileSessionStore(SessionStore):
+    """One file per session in a directory (e.g. on a shared volume); written atomically"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(session_id.encode("utf-8")).hexdigest() + ".session")
+
+    def _read(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "rb") as f:
+                record = decode_session(f.read())
+        except FileNotFoundError:
+            return None
+        except (ValueError, zlib.error) as e:
+            logger.warning(f"Unreadable session file {path}: {e}")
+            return None
+        if record["expires_at"] <= time.time():
+            self._remove(path)
+            return None
+        return record
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        record = await asyncio.to_thread(self._read, self._path(session_id))
+        return record["data"] if record else None
+
+    async def set(self, session_id: str, data: Dict[str, Any], ttl_seconds: float):
+        await asyncio.to_thread(self._write, session_id, data, ttl_seconds)
+
+    async def delete(self, session_id: str):
+        await asyncio.to_thread(self._remove, self._path(session_id))
+
+    async def scan(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        paths = await asyncio.to_thread(self._session_paths)
+        for path in paths:
+            record = await asyncio.to_thread(self._read, path)
+            if record:
+                yield record["session_id"], record["data"]
+
+    def _write(self, session_id: str, data: Dict[str, Any], ttl_seconds: float):
+        path = self._path(session_id)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(encode_session({
+                "session_id": session_id, "expires_at": time.time() + ttl_seconds, "data": data
+            }))
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _session_paths(self) -> List[str]:
+        return [entry.path for entry in os.scandir(self.directory) if entry.name.endswith(".session")]
+
+    def purge_expired(self) -> int:
+        deleted = 0
+        for path in self._session_paths():
+            # Reading an expired session deletes it
+            self._read(path)
+            deleted += not os.path.exists(path)
+        return deleted
+
+
+class RedisSessionStore(SessionStore):
+    """Sessions in Redis, for workers spread over several hosts"""
+
+    KEY_PREFIX = "chat_session:"
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        blob = await self._redis.get(self.KEY_PREFIX + session_id)
+        return decode_session(blob) if blob else None
+
+    async def set(self, session_id: str, data: Dict[str, Any], ttl_seconds: float):
+        await self._redis.set(self.KEY_PREFIX + session_id, encode_session(data), ex=max(1, int(ttl_seconds)))
+
+    async def delete(self, session_id: str):
+        await self._redis.delete(self.KEY_PREFIX + session_id)
+
+    async def scan(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        async for key in self._redis.scan_iter(match=self.KEY_PREFIX + "*"):
+            blob = await self._redis.get(key)
+            if blob:
+                yield key.decode("utf-8")[len(self.KEY_PREFIX):], decode_session(blob)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+# Rough cost of a live agent (object, dicts, per-session collection name) and of each
+# ChatMessageContent (pydantic model, items list, metadata) on top of its text
+AGENT_OVERHEAD_BYTES = 4096
+MESSAGE_OVERHEAD_BYTES = 1024
+
+
+def estimate_session_bytes(record: Dict[str, Any]) -> int:
+    """Approximate memory held by a live session, from its stored-form record
+    (the kernel and models are shared by every session and not counted)"""
+    text_bytes = len(json.dumps(record, ensure_ascii=False, default=str).encode("utf-8"))
+    return AGENT_OVERHEAD_BYTES + len(record["agent"]["history"]) * MESSAGE_OVERHEAD_BYTES + text_bytes
+
+
+class LiveSessionCache:
+    """In-process chat sessions (SESSION_STORE_BACKEND=memory), bounded in count and
+    approximate memory with least-recently-used eviction.
+
+    A background sweeper drops sessions idle for longer than the TTL and, when an
+    external store is configured instead, purges its expired sessions.
+    """
+
+    def __init__(self, max_sessions: int, max_bytes: int, idle_ttl_seconds: float, sweep_seconds: float):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.sweep_seconds = sweep_seconds
+        self.total_bytes = 0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+        self.purged_expired = 0
+        # session_id -> session, least recently used first
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._store: Optional[SessionStore] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The session, marked as most recently used"""
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def peek(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The session, without counting as a use"""
+        return self._sessions.get(session_id)
+
+    def put(self, session_id: str, session: Dict[str, Any], record: Dict[str, Any]):
+        """Add or re-measure a session (`record` is its stored form), then evict down to the limits"""
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        size = estimate_session_bytes(record)
+        self.total_bytes += size - self._sizes.get(session_id, 0)
+        self._sizes[session_id] = size
+
+        # Never evicts the session just added
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions or self.total_bytes > self.max_bytes
+        ):
+            evicted_id = next(iter(self._sessions))
+            self.pop(evicted_id)
+            self.evicted_lru += 1
+            logger.info(f"Evicted least recently used chat session {evicted_id}")
+
+    def pop(self, session_id: str) -> Optional[Dict[str, Any]]:
+        self.total_bytes -= self._sizes.pop(session_id, 0)
+        return self._sessions.pop(session_id, None)
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        return list(self._sessions.items())
+
+    def size_of(self, session_id: str) -> int:
+        return self._sizes.get(session_id, 0)
+
+    def sweep(self) -> int:
+        """Drop sessions idle for longer than the TTL; returns how many"""
+        cutoff = datetime.now() - timedelta(seconds=self.idle_ttl_seconds)
+        expired = []
+        # Least recently used first, so the scan stops at the first live session
+        for session_id, session in self._sessions.items():
+            if session['last_activity'] > cutoff:
+                break
+            expired.append(session_id)
+        for session_id in expired:
+            self.pop(session_id)
+        self.evicted_idle += len(expired)
+        return len(expired)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, store: Optional[SessionStore] = None):
+        """Start the sweeper; must be called from the running event loop"""
+        if self.running:
+            return
+        self._store = store
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Started chat session sweeper (every {self.sweep_seconds}s, idle TTL {self.idle_ttl_seconds}s)")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sweep_seconds)
+            try:
+                evicted = self.sweep()
+                purged = await asyncio.to_thread(self._store.purge_expired) if self._store else 0
+                self.purged_expired += purged
+                if evicted or purged:
+                    logger.info(f"Session sweep: {evicted} idle sessions evicted, {purged} expired sessions purged")
+            except Exception as e:
+                logger.error(f"Error sweeping chat sessions: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "approx_memory_bytes": self.total_bytes,
+            "max_memory_bytes": self.max_bytes,
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+            "evicted_idle": self.evicted_idle,
+            "evicted_lru": self.evicted_lru,
+            "purged_expired": self.purged_expired
+        }
+
+
+def create_session_store(backend: str) -> Optional[SessionStore]:
+    """The configured external store, or None for in-process ("memory") sessions"""
+    if backend == "sqlite":
+        return SQLiteSessionStore(SESSION_STORE_PATH)
+    if backend == "file":
+        return FileSessionStore(SESSION_STORE_DIR)
+    if backend == "redis":
+        return RedisSessionStore(SESSION_REDIS_URL)
+    if backend != "memory":
+        logger.error(f"Unknown SESSION_STORE_BACKEND '{backend}', keeping sessions in memory")
+    return None
+
+
+# Process-wide store, closed by the FastAPI shutdown hook in main.py
+session_store = create_session_store(SESSION_STORE_BACKEND)
@@ -0,0 +1,55 @@
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any
+
+from config import STARTUP_BUDGET_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """Collects wall-clock time spent in each startup phase"""
+
+    def __init__(self, budget_seconds: float):
+        self.budget_seconds = budget_seconds
+        self.phases: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float):
+        """Record (or accumulate) the time spent in a phase"""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        logger.info(f"Startup phase '{name}' took {seconds:.3f}s")
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block as a startup phase"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.phases.values())
+
+    def log_summary(self):
+        """Log the per-phase breakdown and warn if the budget was exceeded"""
+        breakdown = ", ".join(f"{name}={seconds:.3f}s" for name, seconds in self.phases.items())
+        logger.info(f"Startup report: total={self.total_seconds:.3f}s ({breakdown})")
+        if self.total_seconds > self.budget_seconds:
+            logger.warning(
+                f"Startup took {self.total_seconds:.3f}s, over the {self.budget_seconds:.1f}s budget"
+            )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            "total_seconds": round(self.total_seconds, 4),
+            "budget_seconds": self.budget_seconds,
+            "within_budget": self.total_seconds <= self.budget_seconds
+        }
+
+
+# Process-wide report filled in by main.py and the kernel setup
+startup_report = StartupReport(STARTUP_BUDGET_SECONDS)
@@ -1,8 +1,17 @@
 import re
-from typing import Optional, List, Tuple
+import json
+import base64
+import hashlib
+import aiofiles
+from collections import Counter, defaultdict
+from typing import Optional, List, Tuple, Dict, Any, Iterable, AsyncIterator
+from sqlalchemy import select, update, func, delete, and_, or_, false, tuple_, event
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from models import ServiceRequestModel, RequestStatus
-from datetime import datetime
+from models import (
+    ServiceRequestModel, RequestStatusCountModel, RequestDailyCountModel, ServiceNameGramModel, RequestStatus
+)
+from datetime import datetime, date, timedelta
 
 def sanitize_collection_name(name: str) -> str:
     """Sanitize collection name for ChromaDB"""
@@ -29,34 +38,484 @@ def sanitize_collection_name(name: str) -> str:
     
     return sanitized or "default_collection"
 
-def get_request_by_id(db: Session, request_id: str) -> Optional[ServiceRequestModel]:
-    """Get request by ID"""
-    return db.query(ServiceRequestModel).filter(ServiceRequestModel.request_id == request_id).first()
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured maximum size"""
 
-def get_requests_paginated(db: Session, skip: int = 0, limit: int = 10, 
-                          status: Optional[RequestStatus] = None,
-                          service_name: Optional[str] = None) -> Tuple[List[ServiceRequestModel], int]:
-    """Get paginated requests with filters"""
-    query = db.query(ServiceRequestModel)
+async def save_upload_stream(upload, file_path, max_bytes: int, chunk_size: int) -> Tuple[int, str]:
+    """Stream an UploadFile to disk in fixed-size chunks.
+    Returns (size_bytes, sha256 hex digest); raises UploadTooLargeError past max_bytes.
+    By the time the handler runs, the multipart parser has already spooled the whole body,
+    so this limit bounds what is kept, not what is received; the limit_upload_size
+    middleware in main.py rejects oversized requests from their Content-Length first."""
+    declared_size = getattr(upload, "size", None)
+    if declared_size is not None and declared_size > max_bytes:
+        raise UploadTooLargeError(f"{declared_size} bytes exceeds the {max_bytes} byte limit")
+    
+    hasher = hashlib.sha256()
+    size = 0
+    async with aiofiles.open(file_path, 'wb') as buffer:
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLargeError(f"upload exceeds the {max_bytes} byte limit")
+            hasher.update(chunk)
+            await buffer.write(chunk)
     
+    return size, hasher.hexdigest()
+
+async def get_request_by_id(db: AsyncSession, request_id: str) -> Optional[ServiceRequestModel]:
+    """Get request by ID"""
+    result = await db.execute(
+        select(ServiceRequestModel).where(ServiceRequestModel.request_id == request_id).limit(1)
+    )
+    return result.scalars().first()
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Opaque cursor for the (created_at, id) position of the last row of a page"""
+    payload = json.dumps([created_at.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(payload)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception as e:
+        raise InvalidCursorError(f"invalid cursor: {cursor}") from e
+
+# Arabic diacritics (harakat, superscript alef, Quranic marks) and tatweel
+_ARABIC_MARKS = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+# Letter variants users type interchangeably: hamza forms of alef, alef maqsura, taa marbuta
+_ARABIC_LETTERS = str.maketrans("أإآٱىةؤئ", "اااايهوي")
+GRAM_SIZE = 3
+
+def normalize_search_text(text: str) -> str:
+    """Fold Arabic spelling variants, case and whitespace so that names match as users type them"""
+    text = _ARABIC_MARKS.sub("", text or "").translate(_ARABIC_LETTERS).lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+def text_grams(text: str) -> set:
+    """Trigrams of normalised text; text shorter than a trigram is its own gram"""
+    if len(text) < GRAM_SIZE:
+        return {text} if text else set()
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+def service_name_gram_rows(service_name: str) -> List[Dict[str, str]]:
+    return [
+        {"gram": gram, "service_name": service_name}
+        for gram in text_grams(normalize_search_text(service_name))
+    ]
+
+def insert_ignore(dialect: str, model):
+    """INSERT that skips rows whose primary key already exists, for the bound dialect"""
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        return insert(model).prefix_with("IGNORE")
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model).on_conflict_do_nothing()
+
+# Service names known to be in service_name_grams (names are never removed from it)
+_indexed_service_names: set = set()
+
+@event.listens_for(Session, "after_commit")
+def _remember_indexed_service_names(session):
+    # Only names whose grams were committed; a rolled-back index_service_names retries next time
+    _indexed_service_names.update(session.info.pop("indexed_service_names", ()))
+
+@event.listens_for(Session, "after_rollback")
+def _forget_indexed_service_names(session):
+    session.info.pop("indexed_service_names", None)
+
+async def index_service_names(db: AsyncSession, service_names: Iterable[Optional[str]]):
+    """Add the trigrams of service names not yet in the search index"""
+    new_names = {name for name in service_names if name} - _indexed_service_names
+    if not new_names:
+        return
+    existing = set((await db.execute(
+        select(ServiceNameGramModel.service_name).distinct().where(ServiceNameGramModel.service_name.in_(new_names))
+    )).scalars())
+    rows = [row for name in new_names - existing for row in service_name_gram_rows(name)]
+    if rows:
+        await db.execute(insert_ignore(db.bind.dialect.name, ServiceNameGramModel), rows)
+    db.sync_session.info.setdefault("indexed_service_names", set()).update(new_names)
+
+async def match_service_names(db: AsyncSession, text: str) -> List[str]:
+    """Service names containing `text` after normalisation, found through the trigram index
+    instead of a LIKE '%text%' scan of service_requests"""
+    query_text = normalize_search_text(text)
+    if not query_text:
+        return []
+    grams = text_grams(query_text)
+    candidates = select(ServiceNameGramModel.service_name).distinct()
+    if len(query_text) >= GRAM_SIZE:
+        # Names holding every trigram of the query; confirmed by the substring check below
+        candidates = (
+            select(ServiceNameGramModel.service_name)
+            .where(ServiceNameGramModel.gram.in_(grams))
+            .group_by(ServiceNameGramModel.service_name)
+            .having(func.count(ServiceNameGramModel.gram.distinct()) == len(grams))
+        )
+    names = (await db.execute(candidates)).scalars()
+    return [name for name in names if query_text in normalize_search_text(name)]
+
+async def _request_filters(db: AsyncSession, status: Optional[RequestStatus] = None,
+                           service_name: Optional[str] = None, namespace: Optional[str] = None,
+                           session_id: Optional[str] = None, created_after: Optional[datetime] = None,
+                           created_before: Optional[datetime] = None) -> list:
+    filters = []
+    if created_after:
+        filters.append(ServiceRequestModel.created_at >= created_after)
+    if created_before:
+        filters.append(ServiceRequestModel.created_at < created_before)
     if status:
-        query = query.filter(ServiceRequestModel.status == status)
+        filters.append(ServiceRequestModel.status == status)
+    if namespace:
+        filters.append(ServiceRequestModel.namespace == namespace)
+    if session_id:
+        filters.append(ServiceRequestModel.session_id == session_id)
     if service_name:
-        query = query.filter(ServiceRequestModel.service_name.contains(service_name))
+        names = await match_service_names(db, service_name)
+        filters.append(ServiceRequestModel.service_name.in_(names) if names else false())
+    return filters
+
+async def get_requests_page(db: AsyncSession, cursor: Optional[str] = None, limit: int = 10,
+                            status: Optional[RequestStatus] = None, service_name: Optional[str] = None,
+                            namespace: Optional[str] = None,
+                            session_id: Optional[str] = None) -> Tuple[List[ServiceRequestModel], Optional[str]]:
+    """Newest-first page of requests after `cursor` (keyset pagination on (created_at, id)).
+    Returns (requests, next_cursor); next_cursor is None on the last page."""
+    query = select(ServiceRequestModel).where(
+        *await _request_filters(db, status, service_name, namespace, session_id)
+    )
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.where(or_(
+            ServiceRequestModel.created_at < created_at,
+            and_(ServiceRequestModel.created_at == created_at, ServiceRequestModel.id < row_id)
+        ))
     
-    total = query.count()
-    requests = query.order_by(ServiceRequestModel.created_at.desc()).offset(skip).limit(limit).all()
+    # One extra row tells whether there is a next page, without counting
+    result = await db.execute(
+        query.order_by(ServiceRequestModel.created_at.desc(), ServiceRequestModel.id.desc()).limit(limit + 1)
+    )
+    requests = list(result.scalars().all())
+    next_cursor = None
+    if len(requests) > limit:
+        requests = requests[:limit]
+        next_cursor = encode_cursor(requests[-1].created_at, requests[-1].id)
+    return requests, next_cursor
+
+async def stream_requests(db: AsyncSession, columns: list, batch_size: int = 1000,
+                          **filters) -> AsyncIterator[list]:
+    """Rows of the filtered requests in id order, `batch_size` at a time, read through a
+    server-side cursor so memory does not grow with the result set"""
+    result = await db.stream(
+        select(*columns).where(*await _request_filters(db, **filters))
+        .order_by(ServiceRequestModel.id)
+        .execution_options(yield_per=batch_size)
+    )
+    async for rows in result.mappings().partitions():
+        yield rows
+
+async def count_requests(db: AsyncSession, status: Optional[RequestStatus] = None,
+                         service_name: Optional[str] = None, namespace: Optional[str] = None,
+                         session_id: Optional[str] = None, exact: bool = False) -> int:
+    """Number of requests matching the filters. Unless `exact`, summed from the
+    per-service status counters instead of scanning service_requests (the counters
+    have no namespace/session, so those filters always count exactly)."""
+    if exact or namespace or session_id:
+        return await db.scalar(
+            select(func.count(ServiceRequestModel.id)).where(
+                *await _request_filters(db, status, service_name, namespace, session_id)
+            )
+        ) or 0
     
-    return requests, total
+    query = select(func.coalesce(func.sum(RequestStatusCountModel.count), 0))
+    if status:
+        query = query.where(RequestStatusCountModel.status == _status_value(status))
+    if service_name:
+        names = await match_service_names(db, service_name)
+        if not names:
+            return 0
+        query = query.where(RequestStatusCountModel.service_name.in_(names))
+    return int(await db.scalar(query) or 0)
 
-def update_request_status(db: Session, request_id: str, status: RequestStatus, notes: Optional[str] = None) -> Optional[ServiceRequestModel]:
-    """Update request status"""
-    db_request = get_request_by_id(db, request_id)
-    if db_request:
-        db_request.status = status
-        db_request.updated_at = datetime.now()
+class StatusUpdateConflictError(Exception):
+    """Raised when a request keeps changing status concurrently while it is being updated"""
+
+STATUS_UPDATE_ATTEMPTS = 3
+
+async def update_request_status(db: AsyncSession, request_id: str, status: RequestStatus, notes: Optional[str] = None) -> Optional[ServiceRequestModel]:
+    """Update request status.
+    The UPDATE is guarded on the status that was read, and the counters move only when
+    it changed the row, so two concurrent transitions cannot both apply their deltas;
+    the one that loses re-reads the request and tries again."""
+    new_status = _status_value(status)
+    for _ in range(STATUS_UPDATE_ATTEMPTS):
+        db_request = await get_request_by_id(db, request_id)
+        if not db_request:
+            return None
+        old_status = _status_value(db_request.status)
+        values = {"status": new_status, "updated_at": datetime.now()}
         if notes:
-            db_request.notes = notes
-        db.commit()
-        db.refresh(db_request)
-    return db_request
\ No newline at end of file
+            values["notes"] = notes
+        result = await db.execute(
+            update(ServiceRequestModel)
+            .where(ServiceRequestModel.id == db_request.id, ServiceRequestModel.status == db_request.status)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            if old_status != new_status:
+                await adjust_status_counts(db, {
+                    (db_request.service_name, old_status): -1,
+                    (db_request.service_name, new_status): 1
+                })
+            await db.commit()
+            await db.refresh(db_request)
+            return db_request
+        # Another transition got there first
+        await db.rollback()
+    raise StatusUpdateConflictError(f"request {request_id} changed status concurrently {STATUS_UPDATE_ATTEMPTS} times")
+
+
+BULK_CHUNK_SIZE = 1000
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+async def bulk_update_request_status(db: AsyncSession, status: RequestStatus, notes: Optional[str] = None,
+                                     items: Optional[List[Dict[str, Any]]] = None,
+                                     filters: Optional[Dict[str, Any]] = None,
+                                     expected_status: Optional[RequestStatus] = None,
+                                     max_requests: int = 10000) -> Dict[str, Any]:
+    """Move many requests to `status` in one transaction.
+
+    `items` are dicts with request_id and optional expected_status/expected_updated_at;
+    without items, requests matching `filters` (status, service_name, namespace,
+    session_id, created_before) are changed, at most `max_requests` of them.
+    Rows are read once (locked FOR UPDATE where the database supports it), then
+    changed by set-based UPDATEs guarded on (id, updated_at), so a request changed
+    concurrently is reported as a conflict instead of being overwritten.
+    Outcomes: updated, unchanged (already in that status), conflict, not_found.
+    """
+    new_status = _status_value(status)
+    columns = (
+        ServiceRequestModel.id, ServiceRequestModel.request_id, ServiceRequestModel.service_name,
+        ServiceRequestModel.status, ServiceRequestModel.updated_at
+    )
+    results: Dict[str, Dict[str, Any]] = {}
+    candidates = []
+    truncated = False
+
+    if items is not None:
+        expectations = {item["request_id"]: item for item in items}
+        rows = []
+        for chunk in _chunks(list(expectations), BULK_CHUNK_SIZE):
+            rows += (await db.execute(
+                select(*columns).where(ServiceRequestModel.request_id.in_(chunk)).with_for_update()
+            )).all()
+        found = {row.request_id: row for row in rows}
+        for request_id, item in expectations.items():
+            row = found.get(request_id)
+            expected = item.get("expected_status") or expected_status
+            expected_updated_at = _naive_local(item.get("expected_updated_at"))
+            if row is None:
+                results[request_id] = {"request_id": request_id, "outcome": "not_found", "previous_status": None}
+                continue
+            previous_status = _status_value(row.status)
+            if (expected and previous_status != _status_value(expected)) or \
+                    (expected_updated_at and row.updated_at != expected_updated_at):
+                outcome = "conflict"
+            elif previous_status == new_status:
+                outcome = "unchanged"
+            else:
+                candidates.append(row)
+                continue
+            results[request_id] = {"request_id": request_id, "outcome": outcome, "previous_status": previous_status}
+        order = list(expectations)
+    else:
+        query = select(*columns).where(
+            *await _request_filters(db, **(filters or {})), ServiceRequestModel.status != new_status
+        )
+        if expected_status:
+            query = query.where(ServiceRequestModel.status == _status_value(expected_status))
+        candidates = (await db.execute(
+            query.order_by(ServiceRequestModel.id).limit(max_requests + 1).with_for_update()
+        )).all()
+        truncated = len(candidates) > max_requests
+        candidates = candidates[:max_requests]
+        order = [row.request_id for row in candidates]
+
+    # Whole seconds: MySQL DATETIME columns round fractions away, and the value must read back as written
+    now = datetime.now().replace(microsecond=0)
+    values = {"status": new_status, "updated_at": now}
+    if notes:
+        values["notes"] = notes
+    returning = db.bind.dialect.update_returning
+    updated_ids = set()
+    for chunk in _chunks(candidates, BULK_CHUNK_SIZE):
+        chunk_ids = [row.id for row in chunk]
+        statement = (
+            update(ServiceRequestModel)
+            .where(tuple_(ServiceRequestModel.id, ServiceRequestModel.updated_at).in_(
+                [(row.id, row.updated_at) for row in chunk]
+            ))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if returning:
+            # The database reports exactly which rows the guarded UPDATE wrote
+            updated_ids.update((await db.execute(statement.returning(ServiceRequestModel.id))).scalars())
+            continue
+        result = await db.execute(statement)
+        if result.rowcount == len(chunk):
+            updated_ids.update(chunk_ids)
+        else:
+            # Some rows changed between the read and the UPDATE (rare: they were read FOR UPDATE)
+            updated_ids.update((await db.execute(
+                select(ServiceRequestModel.id).where(
+                    ServiceRequestModel.id.in_(chunk_ids),
+                    ServiceRequestModel.status == new_status,
+                    ServiceRequestModel.updated_at == now
+                )
+            )).scalars())
+
+    deltas: Dict[Tuple[Optional[str], str], int] = defaultdict(int)
+    for row in candidates:
+        previous_status = _status_value(row.status)
+        outcome = "conflict"
+        if row.id in updated_ids:
+            outcome = "updated"
+            deltas[(row.service_name, previous_status)] -= 1
+            deltas[(row.service_name, new_status)] += 1
+        results[row.request_id] = {"request_id": row.request_id, "outcome": outcome, "previous_status": previous_status}
+    await adjust_status_counts(db, deltas)
+    await db.commit()
+
+    ordered = [results[request_id] for request_id in order]
+    return {
+        "status": new_status,
+        "updated_at": now.isoformat(),
+        "matched": len(ordered),
+        "updated": len(updated_ids),
+        "outcomes": dict(Counter(result["outcome"] for result in ordered)),
+        "truncated": truncated,
+        "results": ordered
+    }
+
+def _naive_local(value: Optional[datetime]) -> Optional[datetime]:
+    """Timestamps are stored naive in local time (datetime.now()); convert aware ones to match"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+def _status_value(status) -> str:
+    return status.value if isinstance(status, RequestStatus) else str(status)
+
+def _upsert_add(db: AsyncSession, model, keys: Dict[str, Any], delta: int):
+    """INSERT ... ON CONFLICT/DUPLICATE KEY UPDATE count = count + delta for the bound dialect"""
+    dialect = db.bind.dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(model).values(**keys, count=delta)
+        return stmt.on_duplicate_key_update(count=model.count + delta)
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(model).values(**keys, count=delta)
+    return stmt.on_conflict_do_update(index_elements=list(keys), set_={"count": model.count + delta})
+
+async def adjust_status_counts(db: AsyncSession, deltas: Dict[Tuple[Optional[str], str], int]):
+    """Apply {(service_name, status): delta} to the per-service status counters (same transaction as the change)"""
+    for (service_name, status), delta in deltas.items():
+        if delta:
+            await db.execute(_upsert_add(
+                db, RequestStatusCountModel, {"service_name": service_name or "", "status": status}, delta
+            ))
+
+async def count_new_requests(db: AsyncSession, rows: Iterable[Dict[str, Any]]):
+    """Add newly inserted service_requests rows (dicts) to the status and daily counters
+    and their service names to the search index"""
+    rows = list(rows)
+    await index_service_names(db, (row.get("service_name") for row in rows))
+    await adjust_status_counts(db, Counter(
+        (row.get("service_name"), _status_value(row.get("status") or RequestStatus.PENDING)) for row in rows
+    ))
+    for day, delta in Counter((row.get("created_at") or datetime.now()).date() for row in rows).items():
+        await db.execute(_upsert_add(db, RequestDailyCountModel, {"day": day}, delta))
+
+async def rebuild_request_counters(db: AsyncSession, force: bool = False) -> bool:
+    """Recompute the counters (and the service-name index) from service_requests with two GROUP BY scans.
+    Without `force`, only runs when the counters are empty but requests exist."""
+    if not force:
+        has_counters = await db.scalar(select(RequestStatusCountModel.count).limit(1))
+        has_requests = await db.scalar(select(ServiceRequestModel.id).limit(1))
+        if has_counters is not None or has_requests is None:
+            return False
+
+    await db.execute(delete(RequestStatusCountModel))
+    await db.execute(delete(RequestDailyCountModel))
+    status_rows = (await db.execute(
+        select(ServiceRequestModel.service_name, ServiceRequestModel.status, func.count(ServiceRequestModel.id))
+        .group_by(ServiceRequestModel.service_name, ServiceRequestModel.status)
+    )).all()
+    for service_name, status, count in status_rows:
+        db.add(RequestStatusCountModel(service_name=service_name or "", status=status, count=count))
+    day_rows = (await db.execute(
+        select(func.date(ServiceRequestModel.created_at), func.count(ServiceRequestModel.id))
+        .group_by(func.date(ServiceRequestModel.created_at))
+    )).all()
+    for day, count in day_rows:
+        if day is not None:
+            db.add(RequestDailyCountModel(day=date.fromisoformat(day) if isinstance(day, str) else day, count=count))
+    
+    # The service-name search index is derived from the same rows
+    await db.execute(delete(ServiceNameGramModel))
+    _indexed_service_names.clear()
+    await index_service_names(db, (service_name for service_name, _, _ in status_rows))
+    await db.commit()
+    return True
+
+async def get_request_stats(db: AsyncSession) -> Dict[str, Any]:
+    """Request statistics from the counter tables: cost depends on the number of services, not requests"""
+    counts = (await db.execute(
+        select(RequestStatusCountModel.service_name, RequestStatusCountModel.status, RequestStatusCountModel.count)
+    )).all()
+    by_status: Counter = Counter()
+    by_service: Counter = Counter()
+    for service_name, status, count in counts:
+        by_status[status] += count
+        by_service[service_name] += count
+
+    # Daily buckets: the last 7 days plus today
+    week_ago = (datetime.now() - timedelta(days=7)).date()
+    recent_requests = await db.scalar(
+        select(func.coalesce(func.sum(RequestDailyCountModel.count), 0)).where(RequestDailyCountModel.day >= week_ago)
+    )
+
+    return {
+        "total_requests": sum(by_status.values()),
+        "pending_requests": by_status[RequestStatus.PENDING.value],
+        "completed_requests": by_status[RequestStatus.COMPLETED.value],
+        "in_progress_requests": by_status[RequestStatus.IN_PROGRESS.value],
+        "rejected_requests": by_status[RequestStatus.REJECTED.value],
+        "cancelled_requests": by_status[RequestStatus.CANCELLED.value],
+        "recent_requests_week": int(recent_requests or 0),
+        "service_distribution": [
+            {"service_name": service_name or "غير محدد", "count": count}
+            for service_name, count in by_service.most_common()
+            if count
+        ]
+    }